@@ -5,13 +5,23 @@ from flask_caching import Cache
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_session import Session
+from app.utils import ViewCounter, LastSeenTracker, SearchEngine, SQLiteTuning, ConnectionRouter, RoutingSession, CacheGenerations, QueryProfiler, Metrics, PasswordHasher
 import os
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 cache = Cache()
 limiter = Limiter(key_func=get_remote_address)
 sess = Session()
+view_counter = ViewCounter()
+last_seen_tracker = LastSeenTracker()
+search_engine = SearchEngine()
+sqlite_tuning = SQLiteTuning()
+connection_router = ConnectionRouter()
+cache_generations = CacheGenerations()
+query_profiler = QueryProfiler()
+metrics = Metrics()
+password_hasher = PasswordHasher()
 
 def create_app(config_name='development'):
     app = Flask(__name__)
@@ -19,10 +29,19 @@ def create_app(config_name='development'):
     
     # Initialize extensions
     db.init_app(app)
+    sqlite_tuning.init_app(app)
+    connection_router.init_app(app)
+    query_profiler.init_app(app)  # First, so its hooks see the whole request
+    metrics.init_app(app)
     login_manager.init_app(app)
     cache.init_app(app)
     limiter.init_app(app)
     sess.init_app(app)
+    view_counter.init_app(app)
+    last_seen_tracker.init_app(app)
+    search_engine.init_app(app)
+    cache_generations.init_app(app)
+    password_hasher.init_app(app)
     
     # Configure login manager
     login_manager.login_view = 'auth.login'
@@ -41,12 +60,22 @@ def create_app(config_name='development'):
     app.register_blueprint(forum_bp, url_prefix='/forum')
     app.register_blueprint(messages_bp, url_prefix='/messages')
     
+    # Register maintenance commands
+    from app.cli import register_commands
+    register_commands(app)
+    
     # Register main routes
     @app.route('/')
     def index():
         from app.views.forum import forum_bp
         return forum_bp.index()
     
+    # Template filters
+    @app.template_filter('nl2br')
+    def nl2br(value):
+        from markupsafe import Markup, escape
+        return Markup('<br>\n').join(escape(value).split('\n'))
+    
     # Error handlers
     @app.errorhandler(404)
     def not_found_error(error):
@@ -57,25 +86,4 @@ def create_app(config_name='development'):
         db.session.rollback()
         return 'Interner Serverfehler', 500
     
-    # Performance monitoring
-    @app.after_request
-    def after_request(response):
-        # Log slow queries in development
-        if app.config.get('SQLALCHEMY_ECHO'):
-            from sqlalchemy import event
-            from sqlalchemy.engine import Engine
-            import time
-            
-            @event.listens_for(Engine, "before_cursor_execute")
-            def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-                conn.info.setdefault('query_start_time', []).append(time.time())
-            
-            @event.listens_for(Engine, "after_cursor_execute")
-            def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-                total = time.time() - conn.info['query_start_time'].pop()
-                if total > 0.1:  # Log queries slower than 100ms
-                    app.logger.warning(f'Slow query ({total:.3f}s): {statement}')
-        
-        return response
-    
     return app
\ No newline at end of file
@@ -0,0 +1,237 @@
+"""
+Maintenance commands for the Flask CLI (flask <command>)
+"""
+
+import click
+import warnings
+from sqlalchemy import Column, inspect, text
+from app import db
+
+
+def add_missing_columns(table, columns):
+    """Add columns that db.create_all() cannot add to existing tables
+
+    `columns` maps column names to their SQL definition.
+    """
+    existing = [column['name'] for column in inspect(db.engine).get_columns(table)]
+    for name, definition in columns.items():
+        if name not in existing:
+            click.echo(f'Adding {table}.{name} column...')
+            db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {definition}'))
+    db.session.commit()
+
+
+def register_commands(app):
+    """Register maintenance commands on the app"""
+
+    @app.cli.command('backfill-paths')
+    def backfill_paths():
+        """Add the posts.path column if missing and fill in all reply paths"""
+        from app.models import Post
+        from app.models.post import path_segment
+
+        add_missing_columns('posts', {'path': 'VARCHAR(255)'})
+        db.session.execute(text(
+            'CREATE INDEX IF NOT EXISTS idx_post_thread_path ON posts (thread_id, path)'
+        ))
+
+        # Parents are always inserted before their replies, so id order is enough
+        paths = {}
+        mappings = []
+        rows = db.session.query(Post.id, Post.parent_id).order_by(Post.id.asc())
+        for post_id, parent_id in rows:
+            paths[post_id] = paths.get(parent_id, '') + path_segment(post_id)
+            mappings.append({'id': post_id, 'path': paths[post_id]})
+
+        db.session.bulk_update_mappings(Post, mappings)
+        db.session.commit()
+        click.echo(f'Backfilled paths for {len(mappings)} posts.')
+
+    @app.cli.command('recount')
+    def recount():
+        """Rebuild the stored thread/post counters and last-post pointers"""
+        add_missing_columns('threads', {
+            'post_count': 'INTEGER NOT NULL DEFAULT 0',
+            'last_post_id': 'INTEGER',
+            'last_post_at': 'DATETIME',
+        })
+        add_missing_columns('categories', {
+            'is_locked': 'BOOLEAN NOT NULL DEFAULT 0',
+            'thread_count': 'INTEGER NOT NULL DEFAULT 0',
+            'post_count': 'INTEGER NOT NULL DEFAULT 0',
+            'last_post_id': 'INTEGER',
+            'last_post_at': 'DATETIME',
+        })
+
+        # Threads first, categories are aggregated from the thread counters
+        db.session.execute(text("""
+            UPDATE threads SET
+                post_count = (SELECT COUNT(*) FROM posts
+                              WHERE posts.thread_id = threads.id AND posts.is_deleted = 0),
+                last_post_id = (SELECT posts.id FROM posts
+                                WHERE posts.thread_id = threads.id AND posts.is_deleted = 0
+                                ORDER BY posts.created_at DESC, posts.id DESC LIMIT 1),
+                last_post_at = (SELECT MAX(posts.created_at) FROM posts
+                                WHERE posts.thread_id = threads.id AND posts.is_deleted = 0)
+        """))
+        db.session.execute(text("""
+            UPDATE categories SET
+                thread_count = (SELECT COUNT(*) FROM threads
+                                WHERE threads.category_id = categories.id AND threads.is_deleted = 0),
+                post_count = (SELECT COALESCE(SUM(threads.post_count), 0) FROM threads
+                              WHERE threads.category_id = categories.id AND threads.is_deleted = 0),
+                last_post_id = (SELECT threads.last_post_id FROM threads
+                                WHERE threads.category_id = categories.id AND threads.is_deleted = 0
+                                AND threads.last_post_id IS NOT NULL
+                                ORDER BY threads.last_post_at DESC LIMIT 1),
+                last_post_at = (SELECT MAX(threads.last_post_at) FROM threads
+                                WHERE threads.category_id = categories.id AND threads.is_deleted = 0)
+        """))
+        db.session.commit()
+        click.echo('Recounted threads and categories.')
+
+    @app.cli.command('rebuild-conversations')
+    def rebuild_conversations():
+        """Group messages without a conversation into conversations and recount all of them"""
+        from app.models import Conversation, Message
+
+        db.create_all()
+        add_missing_columns('messages', {'conversation_id': 'INTEGER REFERENCES conversations (id)'})
+        db.session.execute(text(
+            'CREATE INDEX IF NOT EXISTS idx_message_conversation ON messages (conversation_id, created_at)'
+        ))
+
+        # Replies only got a "Re: " prefix, so a user pair plus the bare subject is one dialogue
+        conversations = {}
+        mappings = []
+        rows = db.session.query(Message.id, Message.sender_id, Message.recipient_id, Message.subject).filter(
+            Message.conversation_id.is_(None)
+        ).order_by(Message.id.asc())
+        for message_id, sender_id, recipient_id, subject in rows.all():
+            while subject.startswith('Re: '):
+                subject = subject[4:]
+            key = (min(sender_id, recipient_id), max(sender_id, recipient_id), subject)
+            if key not in conversations:
+                conversations[key] = Conversation.start(subject, [sender_id, recipient_id])
+                db.session.flush()
+            mappings.append({'id': message_id, 'conversation_id': conversations[key].id})
+        db.session.bulk_update_mappings(Message, mappings)
+
+        db.session.execute(text("""
+            UPDATE conversations SET
+                message_count = (SELECT COUNT(*) FROM messages
+                                 WHERE messages.conversation_id = conversations.id),
+                last_message_id = (SELECT messages.id FROM messages
+                                   WHERE messages.conversation_id = conversations.id
+                                   ORDER BY messages.created_at DESC, messages.id DESC LIMIT 1),
+                last_message_at = (SELECT MAX(messages.created_at) FROM messages
+                                   WHERE messages.conversation_id = conversations.id)
+        """))
+        db.session.execute(text("""
+            UPDATE conversation_participants SET
+                unread_count = (SELECT COUNT(*) FROM messages
+                                WHERE messages.conversation_id = conversation_participants.conversation_id
+                                AND messages.recipient_id = conversation_participants.user_id
+                                AND messages.is_read = 0 AND messages.is_deleted_by_recipient = 0),
+                is_deleted = NOT EXISTS (SELECT 1 FROM messages
+                                         WHERE messages.conversation_id = conversation_participants.conversation_id
+                                         AND ((messages.sender_id = conversation_participants.user_id
+                                               AND messages.is_deleted_by_sender = 0)
+                                              OR (messages.recipient_id = conversation_participants.user_id
+                                                  AND messages.is_deleted_by_recipient = 0))),
+                last_message_at = COALESCE((SELECT conversations.last_message_at FROM conversations
+                                            WHERE conversations.id = conversation_participants.conversation_id),
+                                           last_message_at)
+        """))
+        db.session.commit()
+        click.echo(f'Grouped {len(mappings)} messages into {len(conversations)} new conversations.')
+
+    @app.cli.command('search-rebuild')
+    def search_rebuild():
+        """Create the full-text search index if missing and rebuild it"""
+        from app import search_engine
+        search_engine.rebuild()
+        click.echo('Search index rebuilt.')
+
+    @app.cli.command('sync-indexes')
+    def sync_indexes():
+        """Create missing model indexes and drop indexes the models no longer declare"""
+        declared = {}
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                declared[index.name] = index
+
+        inspector = inspect(db.engine)
+        existing = set()
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            with warnings.catch_warnings():
+                warnings.filterwarnings('ignore', 'Skipped unsupported reflection of expression-based index')
+                indexes = inspector.get_indexes(table.name)
+            for index in indexes:
+                wanted = declared.get(index['name'])
+                if wanted is not None and [c.name for c in wanted.columns] == index['column_names']:
+                    existing.add(index['name'])
+                    continue
+                click.echo(f'Dropping {index["name"]} on {table.name}')
+                db.session.execute(text(f'DROP INDEX IF EXISTS {index["name"]}'))
+        db.session.commit()
+
+        # Reflection skips expression indexes (e.g. on lower(username)), keep those by name
+        for (name,) in db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")):
+            if name in declared and not all(isinstance(e, Column) for e in declared[name].expressions):
+                existing.add(name)
+
+        for name, index in declared.items():
+            if name not in existing and inspector.has_table(index.table.name):
+                click.echo(f'Creating {name} on {index.table.name}')
+                index.create(db.engine, checkfirst=True)
+
+    @app.cli.command('index-audit')
+    def index_audit():
+        """EXPLAIN the queries of each page and flag full scans and temp B-tree sorts"""
+        from app.utils.index_audit import audited_pages, capture_queries, plan_problems
+
+        pages, user = audited_pages(app)
+        captured = capture_queries(app, pages, user)
+        tables = set(db.metadata.tables)
+        flagged = 0
+        with db.engine.connect() as conn:
+            for page, statements in captured.items():
+                click.echo(f'{page}: {len(statements)} distinct queries')
+                for statement, parameters in statements:
+                    problems = plan_problems(conn, statement, parameters, tables)
+                    if problems:
+                        flagged += 1
+                        click.echo('  ' + ' '.join(statement.split())[:200])
+                        for problem in problems:
+                            click.echo(f'    -> {problem}')
+        click.echo(f'{flagged} queries with full scans or temp B-tree sorts.')
+
+    @app.cli.command('sqlite-maintenance')
+    def sqlite_maintenance():
+        """Checkpoint and truncate the WAL and run PRAGMA optimize (e.g. from cron)"""
+        from app import sqlite_tuning
+        sqlite_tuning.housekeeping(checkpoint='TRUNCATE')
+        click.echo('SQLite maintenance done.')
+    
+    @app.cli.command('bcrypt-calibrate')
+    def bcrypt_calibrate():
+        """Measure the bcrypt cost factor for BCRYPT_TARGET_MS again and store it (restart the workers afterwards)"""
+        from app import password_hasher
+        rounds = password_hasher.recalibrate()
+        click.echo(f'bcrypt cost {rounds} stored in {password_hasher.path}.')
+        if app.config.get('BCRYPT_ROUNDS'):
+            click.echo(f'BCRYPT_ROUNDS={app.config["BCRYPT_ROUNDS"]} is set and takes precedence.')
+    
+    @app.cli.command('cache-stats')
+    def cache_stats():
+        """Show entries, bytes and budget per cache key prefix (hit counters are per process)"""
+        from app import cache
+        backend = cache.cache
+        if not hasattr(backend, 'stats'):
+            click.echo(f'{type(backend).__name__} does not keep statistics.')
+            return
+        for prefix, stats in backend.stats().items():
+            click.echo(f'{prefix or "(other)":<12} ' + ' '.join(f'{name}={value}' for name, value in stats.items()))
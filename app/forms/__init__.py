@@ -1,9 +1,9 @@
 from .auth_forms import LoginForm, RegistrationForm, ResetPasswordRequestForm, ResetPasswordForm
 from .forum_forms import ThreadForm, PostForm, SearchForm
-from .message_forms import MessageForm
+from .message_forms import MessageForm, ConversationActionForm
 
 __all__ = [
     'LoginForm', 'RegistrationForm', 'ResetPasswordRequestForm', 'ResetPasswordForm',
     'ThreadForm', 'PostForm', 'SearchForm',
-    'MessageForm'
+    'MessageForm', 'ConversationActionForm'
 ]
\ No newline at end of file
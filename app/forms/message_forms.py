@@ -1,12 +1,15 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, SubmitField, SelectField
+from wtforms import StringField, TextAreaField, SubmitField
 from wtforms.validators import DataRequired, Length, ValidationError
+from sqlalchemy import func
 from app.models import User
+from app.models.user import ASCII_LOWER
 
 class MessageForm(FlaskForm):
     """Form for sending private messages"""
-    recipient = SelectField('Empfänger', coerce=int, validators=[
-        DataRequired(message='Empfänger ist erforderlich')
+    recipient = StringField('Empfänger', validators=[
+        DataRequired(message='Empfänger ist erforderlich'),
+        Length(max=80, message='Ungültiger Empfänger')
     ])
     subject = StringField('Betreff', validators=[
         DataRequired(message='Betreff ist erforderlich'),
@@ -20,12 +23,19 @@ class MessageForm(FlaskForm):
 
     def __init__(self, current_user_id, *args, **kwargs):
         super(MessageForm, self).__init__(*args, **kwargs)
-        # Populate recipient choices (exclude current user)
-        users = User.query.filter(User.id != current_user_id, User.is_active == True).all()
-        self.recipient.choices = [(user.id, user.username) for user in users]
+        self.current_user_id = current_user_id
+        self.recipient_user = None
 
     def validate_recipient(self, recipient):
-        """Validate recipient exists and is active"""
-        user = User.query.get(recipient.data)
-        if user is None or not user.is_active:
-            raise ValidationError('Ungültiger Empfänger')
\ No newline at end of file
+        """Validate recipient exists, is active and is not the sender (ignoring case, like the typeahead)"""
+        username = recipient.data.strip()
+        # An exact match wins, usernames are only unique case-sensitively
+        user = User.query.filter_by(username=username).first() or User.query.filter(
+            func.lower(User.username) == username.translate(ASCII_LOWER)
+        ).order_by(User.id).first()
+        if user is None or not user.is_active or user.id == self.current_user_id:
+            raise ValidationError('Ungültiger Empfänger')
+        self.recipient_user = user
+
+class ConversationActionForm(FlaskForm):
+    """Form for the bulk actions of the conversation list (the selected ids are read from the checkboxes)"""
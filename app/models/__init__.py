@@ -3,5 +3,6 @@ from .category import Category
 from .thread import Thread
 from .post import Post
 from .message import Message
+from .conversation import Conversation, ConversationParticipant
 
-__all__ = ['User', 'Category', 'Thread', 'Post', 'Message']
\ No newline at end of file
+__all__ = ['User', 'Category', 'Thread', 'Post', 'Message', 'Conversation', 'ConversationParticipant']
\ No newline at end of file
@@ -5,18 +5,28 @@ class Category(db.Model):
     __tablename__ = 'categories'
     
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=True)
-    parent_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True, index=True)
+    parent_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True)
     
     # Category hierarchy (2-3 levels max)
     parent = db.relationship('Category', remote_side=[id], backref='subcategories')
     
+    # Category status
+    is_locked = db.Column(db.Boolean, default=False, nullable=False)
+    
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     
+    # Denormalized counters and last-post pointer (maintained on write, see `flask recount`)
+    thread_count = db.Column(db.Integer, default=0, nullable=False)
+    post_count = db.Column(db.Integer, default=0, nullable=False)
+    last_post_id = db.Column(db.Integer, nullable=True)
+    last_post_at = db.Column(db.DateTime, nullable=True)
+    
     # Relationships
     threads = db.relationship('Thread', backref='category', lazy='dynamic', cascade='all, delete-orphan')
+    last_post = db.relationship('Post', primaryjoin='foreign(Category.last_post_id) == Post.id', viewonly=True)
     
     # Indexes for performance
     __table_args__ = (
@@ -25,39 +35,44 @@ class Category(db.Model):
     )
     
     def get_thread_count(self):
-        """Get total thread count (cached for performance)"""
-        from app import cache
-        cache_key = f'category_thread_count_{self.id}'
-        count = cache.get(cache_key)
-        if count is None:
-            count = self.threads.filter_by(is_deleted=False).count()
-            cache.set(cache_key, count, timeout=300)  # Cache for 5 minutes
-        return count
+        """Get total thread count (stored counter)"""
+        return self.thread_count
     
     def get_post_count(self):
-        """Get total post count in this category"""
-        from app.models import Post, Thread
-        from app import cache
-        
-        cache_key = f'category_post_count_{self.id}'
-        count = cache.get(cache_key)
-        if count is None:
-            count = Post.query.join(Thread).filter(
-                Thread.category_id == self.id,
-                Post.is_deleted == False,
-                Thread.is_deleted == False
-            ).count()
-            cache.set(cache_key, count, timeout=300)
-        return count
+        """Get total post count in this category (stored counter)"""
+        return self.post_count
     
     def get_last_post(self):
         """Get the most recent post in this category"""
+        return self.last_post
+    
+    def add_thread(self, thread):
+        """Count a new thread (committed by the caller)"""
+        self.thread_count = Category.thread_count + 1
+    
+    def add_post(self, post):
+        """Count a new post and point to it as last post (committed by the caller)"""
+        self.post_count = Category.post_count + 1
+        self.last_post_id = post.id
+        self.last_post_at = post.created_at
+    
+    def update_last_post(self):
+        """Recompute the last-post pointer (after deletions)"""
         from app.models import Post, Thread
-        return Post.query.join(Thread).filter(
+        last_post = Post.query.join(Thread).filter(
             Thread.category_id == self.id,
             Post.is_deleted == False,
             Thread.is_deleted == False
         ).order_by(Post.created_at.desc()).first()
+        self.last_post_id = last_post.id if last_post else None
+        self.last_post_at = last_post.created_at if last_post else None
+    
+    def cache_namespaces(self):
+        """Cache namespaces invalidated when this category changes"""
+        namespaces = ['index', f'category_{self.id}']
+        if self.parent_id:
+            namespaces.append(f'category_{self.parent_id}')
+        return namespaces
     
     def __repr__(self):
         return f'<Category {self.name}>'
\ No newline at end of file
@@ -0,0 +1,134 @@
+from datetime import datetime
+from sqlalchemy import case
+from app import db
+
+class Conversation(db.Model):
+    __tablename__ = 'conversations'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(200), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    # Denormalized counter and last-message pointer (maintained on send, see `flask rebuild-conversations`)
+    message_count = db.Column(db.Integer, default=0, nullable=False)
+    last_message_id = db.Column(db.Integer, nullable=True)
+    last_message_at = db.Column(db.DateTime, nullable=True)
+    
+    # Relationships
+    participants = db.relationship('ConversationParticipant', backref='conversation', cascade='all, delete-orphan')
+    messages = db.relationship('Message', backref='conversation', lazy='dynamic')
+    last_message = db.relationship('Message', primaryjoin='foreign(Conversation.last_message_id) == Message.id', viewonly=True)
+    
+    @staticmethod
+    def start(subject, user_ids):
+        """Create a conversation between users (committed by the caller)"""
+        conversation = Conversation(subject=subject)
+        conversation.participants = [ConversationParticipant(user_id=user_id) for user_id in set(user_ids)]
+        db.session.add(conversation)
+        return conversation
+    
+    def add_message(self, message):
+        """Count a sent message and bump the recipients' unread counters (committed by the caller)"""
+        self.message_count = Conversation.message_count + 1
+        self.last_message_id = message.id
+        self.last_message_at = message.created_at
+        
+        # One UPDATE for all participants; a new message also brings the conversation back for those who deleted it
+        ConversationParticipant.query.filter_by(conversation_id=self.id).update({
+            'unread_count': case(
+                (ConversationParticipant.user_id == message.sender_id, ConversationParticipant.unread_count),
+                else_=ConversationParticipant.unread_count + 1
+            ),
+            'is_deleted': False,
+            'last_message_at': message.created_at,
+        }, synchronize_session=False)
+    
+    def other_participants(self, user_id):
+        """Get the users taking part besides the given one"""
+        return [participant.user for participant in self.participants if participant.user_id != user_id]
+    
+    @staticmethod
+    def mark_read(user_id, conversation_ids):
+        """Mark every message the user received in these conversations as read (one UPDATE per table)"""
+        from app import cache_generations
+        from app.models import Message
+        if not conversation_ids:
+            return
+        
+        Message.query.filter(
+            Message.conversation_id.in_(conversation_ids),
+            Message.recipient_id == user_id,
+            Message.is_read == False
+        ).update({'is_read': True}, synchronize_session=False)
+        ConversationParticipant.query.filter(
+            ConversationParticipant.conversation_id.in_(conversation_ids),
+            ConversationParticipant.user_id == user_id
+        ).update({'unread_count': 0}, synchronize_session=False)
+        
+        # The bulk updates skip the model events
+        cache_generations.touch(db.session, f'user_{user_id}', f'inbox_{user_id}')
+        db.session.commit()
+    
+    @staticmethod
+    def delete_for(user_id, conversation_ids):
+        """Delete conversations and their messages for one user (one UPDATE per table)"""
+        from app import cache_generations
+        from app.models import Message
+        if not conversation_ids:
+            return
+        
+        # Received messages are marked read as well, so they leave the unread count
+        Message.query.filter(
+            Message.conversation_id.in_(conversation_ids),
+            db.or_(Message.sender_id == user_id, Message.recipient_id == user_id)
+        ).update({
+            'is_deleted_by_sender': case((Message.sender_id == user_id, True), else_=Message.is_deleted_by_sender),
+            'is_deleted_by_recipient': case((Message.recipient_id == user_id, True), else_=Message.is_deleted_by_recipient),
+            'is_read': case((Message.recipient_id == user_id, True), else_=Message.is_read),
+        }, synchronize_session=False)
+        ConversationParticipant.query.filter(
+            ConversationParticipant.conversation_id.in_(conversation_ids),
+            ConversationParticipant.user_id == user_id
+        ).update({'is_deleted': True, 'unread_count': 0}, synchronize_session=False)
+        
+        cache_generations.touch(db.session, f'user_{user_id}', f'inbox_{user_id}')
+        db.session.commit()
+    
+    def __repr__(self):
+        return f'<Conversation {self.subject}>'
+
+
+class ConversationParticipant(db.Model):
+    """A user's view of a conversation: unread counter, deletion and list position"""
+    __tablename__ = 'conversation_participants'
+    
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    unread_count = db.Column(db.Integer, default=0, nullable=False)
+    is_deleted = db.Column(db.Boolean, default=False, nullable=False)
+    last_message_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # Copy for the list order
+    
+    user = db.relationship('User')
+    
+    # Index matching the conversation list (see `flask index-audit`)
+    __table_args__ = (
+        db.Index('idx_participant_list', 'user_id', 'is_deleted', 'last_message_at', 'conversation_id'),
+    )
+    
+    @staticmethod
+    def get_list(user_id):
+        """Get the conversations of a user, newest activity first"""
+        from sqlalchemy.orm import joinedload, selectinload
+        return ConversationParticipant.query.filter_by(
+            user_id=user_id,
+            is_deleted=False
+        ).options(
+            joinedload(ConversationParticipant.conversation).joinedload(Conversation.last_message),
+            joinedload(ConversationParticipant.conversation)
+                .selectinload(Conversation.participants)
+                .joinedload(ConversationParticipant.user),
+        ).order_by(ConversationParticipant.last_message_at.desc())
+    
+    def __repr__(self):
+        return f'<ConversationParticipant {self.user_id} in {self.conversation_id}>'
+
@@ -7,48 +7,91 @@ class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     subject = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
-    sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
-    recipient_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    recipient_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id'), nullable=True)
     
     # Message status
-    is_read = db.Column(db.Boolean, default=False, nullable=False, index=True)
+    is_read = db.Column(db.Boolean, default=False, nullable=False)
     is_deleted_by_sender = db.Column(db.Boolean, default=False, nullable=False)
     is_deleted_by_recipient = db.Column(db.Boolean, default=False, nullable=False)
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     
-    # Indexes for performance
+    # Indexes matching the mailbox queries (see `flask index-audit`)
     __table_args__ = (
-        db.Index('idx_message_sender', 'sender_id'),
-        db.Index('idx_message_recipient', 'recipient_id'),
-        db.Index('idx_message_read', 'is_read'),
-        db.Index('idx_message_created', 'created_at'),
+        db.Index('idx_message_inbox', 'recipient_id', 'is_deleted_by_recipient', 'created_at'),
+        db.Index('idx_message_sent', 'sender_id', 'is_deleted_by_sender', 'created_at'),
+        db.Index('idx_message_unread', 'recipient_id', 'is_read'),
+        db.Index('idx_message_conversation', 'conversation_id', 'created_at'),
     )
     
+    @staticmethod
+    def send(sender_id, recipient_id, subject, content, reply_to=None):
+        """Send a message, continuing the conversation of `reply_to` if given (committed by the caller)"""
+        from app.models import Conversation
+        conversation = reply_to.conversation if reply_to is not None else None
+        if conversation is None:
+            conversation = Conversation.start(subject, [sender_id, recipient_id])
+        
+        message = Message(
+            subject=subject,
+            content=content,
+            sender_id=sender_id,
+            recipient_id=recipient_id,
+            conversation=conversation
+        )
+        db.session.add(message)
+        db.session.flush()  # Get message ID for the last-message pointer
+        conversation.add_message(message)
+        return message
+    
     def mark_as_read(self):
         """Mark message as read"""
         if not self.is_read:
             self.is_read = True
+            if self.conversation_id is not None:
+                from app.models import ConversationParticipant
+                ConversationParticipant.query.filter(
+                    ConversationParticipant.conversation_id == self.conversation_id,
+                    ConversationParticipant.user_id == self.recipient_id,
+                    ConversationParticipant.unread_count > 0
+                ).update({'unread_count': ConversationParticipant.unread_count - 1}, synchronize_session=False)
             db.session.commit()
-            
-            # Clear unread message cache
-            from app import cache
-            cache.delete(f'user_unread_messages_{self.recipient_id}')
     
     def soft_delete(self, user_id):
-        """Soft delete message for specific user"""
+        """Soft delete message for specific user, keeping the conversation's counters in step"""
+        from app import cache_generations
+        from app.models import ConversationParticipant
         if user_id == self.sender_id:
             self.is_deleted_by_sender = True
         elif user_id == self.recipient_id:
             self.is_deleted_by_recipient = True
+            # Marked read as well, so it leaves the unread counts (as in Conversation.delete_for)
+            if not self.is_read:
+                self.is_read = True
+                if self.conversation_id is not None:
+                    ConversationParticipant.query.filter(
+                        ConversationParticipant.conversation_id == self.conversation_id,
+                        ConversationParticipant.user_id == user_id,
+                        ConversationParticipant.unread_count > 0
+                    ).update({'unread_count': ConversationParticipant.unread_count - 1}, synchronize_session=False)
+        else:
+            return
         
-        db.session.commit()
+        # The conversation leaves the list with the user's last visible message
+        if self.conversation_id is not None:
+            db.session.flush()
+            if Message.get_conversation(self.conversation_id, user_id).first() is None:
+                ConversationParticipant.query.filter_by(
+                    conversation_id=self.conversation_id,
+                    user_id=user_id
+                ).update({'is_deleted': True, 'unread_count': 0}, synchronize_session=False)
         
-        # Clear unread message cache if recipient deleted
-        if user_id == self.recipient_id and not self.is_read:
-            from app import cache
-            cache.delete(f'user_unread_messages_{self.recipient_id}')
+        # The bulk updates skip the model events
+        cache_generations.touch(db.session, f'user_{user_id}', f'inbox_{user_id}')
+        db.session.commit()
     
     @staticmethod
     def get_inbox(user_id):
@@ -66,5 +109,20 @@ class Message(db.Model):
             Message.is_deleted_by_sender == False
         ).order_by(Message.created_at.desc())
     
+    @staticmethod
+    def get_conversation(conversation_id, user_id):
+        """Get the messages of a conversation the user has not deleted"""
+        return Message.query.filter(
+            Message.conversation_id == conversation_id,
+            db.or_(
+                db.and_(Message.sender_id == user_id, Message.is_deleted_by_sender == False),
+                db.and_(Message.recipient_id == user_id, Message.is_deleted_by_recipient == False)
+            )
+        ).order_by(Message.created_at.asc())
+    
+    def cache_namespaces(self):
+        """Cache namespaces invalidated when this message changes"""
+        return [f'user_{self.sender_id}', f'user_{self.recipient_id}', f'inbox_{self.recipient_id}']
+    
     def __repr__(self):
         return f'<Message {self.subject} from {self.sender_id} to {self.recipient_id}>'
\ No newline at end of file
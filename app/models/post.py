@@ -1,16 +1,33 @@
 from datetime import datetime
 from app import db
 
+# Materialized path: one fixed-width segment per level, e.g. '00000001/00000005/'
+PATH_SEGMENT_DIGITS = 8
+PATH_SEGMENT_LENGTH = PATH_SEGMENT_DIGITS + 1
+PATH_MAX_LENGTH = 255
+# Deepest reply level whose path fits the column (SQLite would not enforce its length)
+MAX_REPLY_DEPTH = PATH_MAX_LENGTH // PATH_SEGMENT_LENGTH - 1
+
+def path_segment(post_id):
+    """Get the path segment for a post id"""
+    return f'{post_id:0{PATH_SEGMENT_DIGITS}d}/'
+
+def path_range(path):
+    """Get the (exclusive) bounds of all paths below the given path"""
+    # '/' sorts directly before '0', so bumping the trailing '/' closes the range
+    return path, path[:-1] + '0'
+
 class Post(db.Model):
     __tablename__ = 'posts'
     
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
-    thread_id = db.Column(db.Integer, db.ForeignKey('threads.id'), nullable=False, index=True)
-    author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    thread_id = db.Column(db.Integer, db.ForeignKey('threads.id'), nullable=False)
+    author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     
     # Post hierarchy (for threaded replies)
-    parent_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=True, index=True)
+    parent_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=True)
+    path = db.Column(db.String(PATH_MAX_LENGTH), nullable=True)  # Materialized path, set after insert
     
     # Image upload preparation
     has_image = db.Column(db.Boolean, default=False, nullable=False)
@@ -21,7 +38,7 @@ class Post(db.Model):
     longitude = db.Column(db.DECIMAL(11, 8), nullable=True)
     
     # Post status
-    is_deleted = db.Column(db.Boolean, default=False, nullable=False, index=True)
+    is_deleted = db.Column(db.Boolean, default=False, nullable=False)
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -30,28 +47,115 @@ class Post(db.Model):
     # Relationships
     parent = db.relationship('Post', remote_side=[id], backref='replies')
     
-    # Indexes for performance
+    # Indexes matching the thread page, reply tree and profile queries (see `flask index-audit`)
     __table_args__ = (
-        db.Index('idx_post_thread', 'thread_id'),
-        db.Index('idx_post_author', 'author_id'),
-        db.Index('idx_post_parent', 'parent_id'),
-        db.Index('idx_post_deleted', 'is_deleted'),
-        db.Index('idx_post_created', 'created_at'),
+        db.Index('idx_post_thread_listing', 'thread_id', 'is_deleted', 'parent_id', 'created_at'),
+        db.Index('idx_post_thread_path', 'thread_id', 'path'),
+        db.Index('idx_post_author', 'author_id', 'is_deleted', 'created_at'),
     )
     
     def soft_delete(self):
         """Soft delete post"""
+        if self.is_deleted:
+            return
+        
+        from app.models import Thread, Category
         self.is_deleted = True
+        thread = self.thread
+        thread.post_count = Thread.post_count - 1
+        if not thread.is_deleted:
+            thread.category.post_count = Category.post_count - 1
+        
+        db.session.flush()
+        if thread.last_post_id == self.id:
+            thread.update_last_post()
+        if thread.category.last_post_id == self.id:
+            thread.category.update_last_post()
         db.session.commit()
+    
+    @property
+    def fragment_version(self):
+        """Version of the cached rendering (changes whenever the post is updated)"""
+        return self.updated_at.strftime('%Y%m%d%H%M%S%f')
+    
+    @staticmethod
+    def get_thread_page(thread_id, per_page, after=None, before=None):
+        """Get a page of top-level posts plus their reply trees (bounded query count)"""
+        from sqlalchemy.orm import joinedload
+        from app.utils.pagination import keyset_paginate
+        query = Post.query.options(joinedload(Post.author)).filter_by(
+            thread_id=thread_id,
+            is_deleted=False,
+            parent_id=None
+        )
+        posts = keyset_paginate(query, [Post.created_at, Post.id], per_page,
+                                after=after, before=before)
+        return posts, Post.get_reply_tree(posts.items)
+    
+    @staticmethod
+    def get_reply_tree(posts):
+        """Get all descendant replies of the given posts, grouped by parent id
         
-        # Clear relevant caches
-        from app import cache
-        cache.delete(f'thread_post_count_{self.thread_id}')
-        cache.delete(f'user_post_count_{self.author_id}')
-        cache.delete(f'category_post_count_{self.thread.category_id}')
+        Uses one indexed range query over the materialized paths.
+        """
+        from sqlalchemy import or_, and_
+        from sqlalchemy.orm import joinedload
+        posts = [post for post in posts if post.path]
+        if not posts:
+            return {}
+        
+        subtrees = []
+        for post in posts:
+            low, high = path_range(post.path)
+            subtrees.append(and_(Post.path > low, Post.path < high))
+        
+        descendants = Post.query.options(joinedload(Post.author)).filter(
+            Post.thread_id == posts[0].thread_id,
+            Post.is_deleted == False,
+            or_(*subtrees)
+        ).order_by(Post.path.asc()).all()
+        
+        replies = {}
+        for reply in descendants:
+            replies.setdefault(reply.parent_id, []).append(reply)
+        return replies
+    
+    def update_path(self, parent=None):
+        """Set the materialized path (the post must be flushed so it has an id)"""
+        parent = parent or self.parent
+        if parent is not None and parent.path is None:
+            return  # Parent not backfilled yet, see `flask backfill-paths`
+        path = (parent.path if parent else '') + path_segment(self.id)
+        if len(path) > PATH_MAX_LENGTH:
+            raise ValueError(f'Replies can be nested at most {MAX_REPLY_DEPTH} levels deep, see reply_target()')
+        self.path = path
+    
+    def reply_target(self):
+        """Get the post a reply to this one is attached to: itself, or at MAX_REPLY_DEPTH its parent"""
+        if not self.path or self.get_reply_depth() < MAX_REPLY_DEPTH:
+            return self
+        # Replies stay on the deepest level, next to this post
+        start = (MAX_REPLY_DEPTH - 1) * PATH_SEGMENT_LENGTH
+        return db.session.get(Post, int(self.path[start:start + PATH_SEGMENT_DIGITS]))
+    
+    def get_subtree(self, include_deleted=False):
+        """Get this post and all its replies, ordered for display (depth-first)"""
+        low, high = path_range(self.path)
+        query = Post.query.filter(
+            Post.thread_id == self.thread_id,
+            Post.path >= low,
+            Post.path < high
+        )
+        if not include_deleted:
+            query = query.filter(Post.is_deleted == False)
+        return query.order_by(Post.path.asc())
     
     def get_reply_depth(self):
         """Get the depth of this post in the reply tree"""
+        if self.path:
+            return len(self.path) // PATH_SEGMENT_LENGTH - 1
+        
+        # Not yet flushed or not backfilled: walk up the tree
         depth = 0
         current = self.parent
         while current:
@@ -59,5 +163,9 @@ class Post(db.Model):
             current = current.parent
         return depth
     
+    def cache_namespaces(self):
+        """Cache namespaces invalidated when this post changes"""
+        return [f'thread_{self.thread_id}', f'user_{self.author_id}']
+    
     def __repr__(self):
         return f'<Post {self.id} in Thread {self.thread_id}>'
\ No newline at end of file
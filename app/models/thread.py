@@ -5,14 +5,14 @@ class Thread(db.Model):
     __tablename__ = 'threads'
     
     id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(200), nullable=False, index=True)
-    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False, index=True)
-    author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    title = db.Column(db.String(200), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
+    author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     
     # Thread status
-    is_pinned = db.Column(db.Boolean, default=False, nullable=False, index=True)
+    is_pinned = db.Column(db.Boolean, default=False, nullable=False)
     is_locked = db.Column(db.Boolean, default=False, nullable=False)
-    is_deleted = db.Column(db.Boolean, default=False, nullable=False, index=True)
+    is_deleted = db.Column(db.Boolean, default=False, nullable=False)
     
     # View counter
     view_count = db.Column(db.Integer, default=0, nullable=False)
@@ -21,49 +21,83 @@ class Thread(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
+    # Denormalized counter and last-post pointer (maintained on write, see `flask recount`)
+    post_count = db.Column(db.Integer, default=0, nullable=False)
+    last_post_id = db.Column(db.Integer, nullable=True)
+    last_post_at = db.Column(db.DateTime, nullable=True)
+    
     # Relationships
     posts = db.relationship('Post', backref='thread', lazy='dynamic', cascade='all, delete-orphan')
+    last_post = db.relationship('Post', primaryjoin='foreign(Thread.last_post_id) == Post.id', viewonly=True)
     
-    # Indexes for performance
+    # Indexes matching the category listing and profile queries (see `flask index-audit`)
     __table_args__ = (
-        db.Index('idx_thread_category', 'category_id'),
-        db.Index('idx_thread_author', 'author_id'),
-        db.Index('idx_thread_pinned', 'is_pinned'),
-        db.Index('idx_thread_deleted', 'is_deleted'),
-        db.Index('idx_thread_created', 'created_at'),
+        db.Index('idx_thread_category_listing', 'category_id', 'is_deleted', 'is_pinned', 'updated_at'),
+        db.Index('idx_thread_author', 'author_id', 'is_deleted', 'created_at'),
     )
     
     def get_post_count(self):
-        """Get total post count (cached)"""
-        from app import cache
-        cache_key = f'thread_post_count_{self.id}'
-        count = cache.get(cache_key)
-        if count is None:
-            count = self.posts.filter_by(is_deleted=False).count()
-            cache.set(cache_key, count, timeout=300)  # Cache for 5 minutes
-        return count
+        """Get total post count (stored counter)"""
+        return self.post_count
     
     def get_last_post(self):
         """Get the most recent post in this thread"""
-        return self.posts.filter_by(is_deleted=False).order_by(Post.created_at.desc()).first()
+        return self.last_post
+    
+    def add_post(self, post):
+        """Count a new post in this thread and its category (committed by the caller)"""
+        self.post_count = Thread.post_count + 1
+        self.last_post_id = post.id
+        self.last_post_at = post.created_at
+        self.category.add_post(post)
+    
+    def update_last_post(self):
+        """Recompute the last-post pointer (after deletions)"""
+        from app.models import Post
+        last_post = self.posts.filter_by(is_deleted=False).order_by(Post.created_at.desc()).first()
+        self.last_post_id = last_post.id if last_post else None
+        self.last_post_at = last_post.created_at if last_post else None
     
     def increment_view_count(self):
-        """Increment view count (thread-safe)"""
-        self.view_count += 1
-        db.session.commit()
+        """Increment view count (buffered, written in batches by the view counter)"""
+        from app import view_counter
+        view_counter.increment(self.id)
+    
+    def get_view_count(self):
+        """Get view count including views not yet written"""
+        from app import view_counter
+        return self.view_count + view_counter.pending(self.id, 0)
     
     def soft_delete(self):
         """Soft delete thread and all its posts"""
+        if self.is_deleted:
+            return
+        
+        from app import cache_generations
+        from app.models import Category, Post
+        removed_posts = self.post_count
+        
+        # The bulk update below skips the model events, so name the post authors here
+        authors = db.session.query(Post.author_id).filter_by(thread_id=self.id).distinct()
+        cache_generations.touch(db.session, *[f'user_{author_id}' for author_id, in authors])
+        
         self.is_deleted = True
-        for post in self.posts:
-            post.is_deleted = True
-        db.session.commit()
+        self.posts.update({'is_deleted': True}, synchronize_session=False)
+        self.post_count = 0
+        self.last_post_id = None
+        self.last_post_at = None
         
-        # Clear relevant caches
-        from app import cache
-        cache.delete(f'category_thread_count_{self.category_id}')
-        cache.delete(f'category_post_count_{self.category_id}')
-        cache.delete(f'user_thread_count_{self.author_id}')
+        category = self.category
+        category.thread_count = Category.thread_count - 1
+        category.post_count = Category.post_count - removed_posts
+        if category.last_post and category.last_post.thread_id == self.id:
+            db.session.flush()
+            category.update_last_post()
+        db.session.commit()
+    
+    def cache_namespaces(self):
+        """Cache namespaces invalidated when this thread changes"""
+        return [f'thread_{self.id}', f'category_{self.category_id}', f'user_{self.author_id}']
     
     def __repr__(self):
         return f'<Thread {self.title}>'
\ No newline at end of file
@@ -1,8 +1,10 @@
-from datetime import datetime
+import string
+from datetime import datetime, timedelta
 from app import db, login_manager
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
-import bcrypt
+
+# SQLite's lower() only folds ASCII letters, prefixes are folded the same way
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -34,58 +36,99 @@ class User(UserMixin, db.Model):
     sent_messages = db.relationship('Message', foreign_keys='Message.sender_id', backref='sender', lazy='dynamic', cascade='all, delete-orphan')
     received_messages = db.relationship('Message', foreign_keys='Message.recipient_id', backref='recipient', lazy='dynamic', cascade='all, delete-orphan')
     
-    # Indexes for performance
+    # Case-insensitive username prefix search (search_usernames)
     __table_args__ = (
-        db.Index('idx_user_username', 'username'),
-        db.Index('idx_user_email', 'email'),
-        db.Index('idx_user_active', 'is_active'),
+        db.Index('idx_user_username_lower', db.func.lower(username)),
     )
     
     def set_password(self, password):
         """Hash password using bcrypt"""
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        from app import password_hasher
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        """Verify password against hash"""
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        """Verify password against hash, rehashing it if the cost factor was raised (the caller commits)"""
+        from app import password_hasher
+        from app.utils import PasswordHasherBusy
+        if not password_hasher.check(password, self.password_hash):
+            return False
+        if password_hasher.needs_rehash(self.password_hash):
+            try:
+                self.password_hash = password_hasher.hash(password)
+            except PasswordHasherBusy:
+                pass  # The upgrade waits for a quieter login, the password is correct either way
+        return True
     
     def get_post_count(self):
-        """Get total post count (cached)"""
-        from app import cache
-        cache_key = f'user_post_count_{self.id}'
+        """Get total post count (cached until the user's generation changes)"""
+        from app import cache, cache_generations
+        cache_key = cache_generations.key(f'user_post_count_{self.id}', f'user_{self.id}')
         count = cache.get(cache_key)
         if count is None:
             from app.models import Post
             count = Post.query.filter_by(author_id=self.id, is_deleted=False).count()
-            cache.set(cache_key, count, timeout=600)  # Cache for 10 minutes
+            cache.set(cache_key, count)
         return count
     
     def get_thread_count(self):
-        """Get total thread count (cached)"""
-        from app import cache
-        cache_key = f'user_thread_count_{self.id}'
+        """Get total thread count (cached until the user's generation changes)"""
+        from app import cache, cache_generations
+        cache_key = cache_generations.key(f'user_thread_count_{self.id}', f'user_{self.id}')
         count = cache.get(cache_key)
         if count is None:
             from app.models import Thread
             count = Thread.query.filter_by(author_id=self.id, is_deleted=False).count()
-            cache.set(cache_key, count, timeout=600)
+            cache.set(cache_key, count)
         return count
     
     def get_unread_message_count(self):
-        """Get unread message count (cached)"""
-        from app import cache
-        cache_key = f'user_unread_messages_{self.id}'
+        """Get unread message count (cached until the user's generation changes)"""
+        from app import cache, cache_generations
+        cache_key = cache_generations.key(f'user_unread_messages_{self.id}', f'user_{self.id}')
         count = cache.get(cache_key)
         if count is None:
             from app.models import Message
             count = Message.query.filter_by(recipient_id=self.id, is_read=False).count()
-            cache.set(cache_key, count, timeout=60)  # Cache for 1 minute
+            cache.set(cache_key, count)
         return count
     
     def update_last_seen(self):
-        """Update last seen timestamp"""
-        self.last_seen = datetime.utcnow()
-        db.session.commit()
+        """Update last seen timestamp (throttled, written in batches)"""
+        from app import last_seen_tracker
+        last_seen_tracker.touch(self)
+    
+    @staticmethod
+    def get_online_users(minutes=15):
+        """Get users seen within the last minutes"""
+        from app import last_seen_tracker
+        last_seen_tracker.flush()
+        since = datetime.utcnow() - timedelta(minutes=minutes)
+        return User.query.filter(User.last_seen >= since, User.is_active == True).order_by(User.username)
+    
+    @staticmethod
+    def search_usernames(prefix, limit=10):
+        """Get usernames of active users starting with prefix, ignoring case (cached per prefix)"""
+        from app import cache, cache_generations
+        prefix = prefix.strip().translate(ASCII_LOWER)
+        if not prefix:
+            return []
+        cache_key = cache_generations.key(f'recipients_{limit}_{prefix}', 'recipients')
+        usernames = cache.get(cache_key)
+        if usernames is None:
+            lowered = db.func.lower(User.username)
+            # Range scan on idx_user_username_lower
+            query = db.session.query(User.username).filter(
+                lowered >= prefix,
+                lowered < prefix + '\U0010ffff',
+                User.is_active == True
+            ).order_by(lowered).limit(limit)
+            usernames = [username for (username,) in query]
+            cache.set(cache_key, usernames)
+        return usernames
+    
+    def cache_namespaces(self):
+        """Cache namespaces invalidated when this user changes"""
+        return [f'user_{self.id}', 'recipients']
     
     def __repr__(self):
         return f'<User {self.username}>'
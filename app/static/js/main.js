@@ -2,28 +2,75 @@
 // Nur essenzielle Funktionen, kein Framework
 
 document.addEventListener('DOMContentLoaded', function() {
-    // Unread message count updater (for real-time notifications)
-    function updateUnreadCount() {
-        if (typeof current_user !== 'undefined' && current_user) {
-            fetch('/messages/unread_count')
+    // Unread message badge, updated by long-polling the inbox generation
+    const messagesItem = document.querySelector('.nav-messages[data-unread-url]');
+    if (messagesItem) {
+        const badge = messagesItem.querySelector('.unread-badge');
+        let since = messagesItem.dataset.unreadSince;
+        let timer = null;
+        let polling = false;
+
+        function schedulePoll(seconds) {
+            clearTimeout(timer);
+            timer = setTimeout(pollUnreadCount, seconds * 1000);
+        }
+
+        function pollUnreadCount() {
+            // Hidden tabs stop polling and catch up when shown again
+            if (document.hidden || polling) {
+                return;
+            }
+            polling = true;
+            fetch(messagesItem.dataset.unreadUrl + '?since=' + encodeURIComponent(since))
                 .then(response => response.json())
                 .then(data => {
-                    const badge = document.querySelector('.unread-badge');
-                    if (badge) {
-                        if (data.unread_count > 0) {
-                            badge.textContent = data.unread_count;
-                            badge.style.display = 'flex';
-                        } else {
-                            badge.style.display = 'none';
-                        }
+                    polling = false;
+                    since = data.since;
+                    if (data.unread_count !== undefined) {
+                        badge.textContent = data.unread_count;
+                        badge.style.display = data.unread_count > 0 ? 'flex' : 'none';
                     }
+                    schedulePoll(Math.max(data.retry, 1));
                 })
-                .catch(error => console.log('Could not update unread count:', error));
+                .catch(error => {
+                    polling = false;
+                    console.log('Could not update unread count:', error);
+                    schedulePoll(300);
+                });
         }
+
+        document.addEventListener('visibilitychange', function() {
+            if (!document.hidden) {
+                pollUnreadCount();
+            }
+        });
+        schedulePoll(Math.max(Number(messagesItem.dataset.unreadDelay), 1));
     }
 
-    // Update unread count every 30 seconds
-    setInterval(updateUnreadCount, 30000);
+    // Recipient typeahead: suggest usernames for the typed prefix
+    const recipientInput = document.querySelector('input[data-recipient-url]');
+    if (recipientInput && recipientInput.list) {
+        let lookup = null;
+        recipientInput.addEventListener('input', function() {
+            clearTimeout(lookup);
+            const prefix = recipientInput.value.trim();
+            if (!prefix) {
+                return;
+            }
+            lookup = setTimeout(() => {
+                fetch(recipientInput.dataset.recipientUrl + '?q=' + encodeURIComponent(prefix))
+                    .then(response => response.json())
+                    .then(data => {
+                        recipientInput.list.replaceChildren(...data.usernames.map(username => {
+                            const option = document.createElement('option');
+                            option.value = username;
+                            return option;
+                        }));
+                    })
+                    .catch(error => console.log('Could not load recipients:', error));
+            }, 200);
+        });
+    }
 
     // Auto-resize textareas
     const textareas = document.querySelectorAll('textarea');
@@ -0,0 +1,12 @@
+from .view_counter import ViewCounter
+from .last_seen import LastSeenTracker
+from .search import SearchEngine
+from .sqlite import SQLiteTuning, ConnectionRouter, RoutingSession
+from .generations import CacheGenerations
+from .query_profiler import QueryProfiler
+from .metrics import Metrics
+from .password_hasher import PasswordHasher, PasswordHasherBusy
+
+__all__ = ['ViewCounter', 'LastSeenTracker', 'SearchEngine', 'SQLiteTuning',
+           'ConnectionRouter', 'RoutingSession', 'CacheGenerations', 'QueryProfiler',
+           'Metrics', 'PasswordHasher', 'PasswordHasherBusy']
@@ -0,0 +1,44 @@
+from flask import current_app, render_template
+from markupsafe import Markup
+
+
+def fragment_key(kind, object_id, version=None):
+    """Get the cache key of a rendered fragment"""
+    key = f'fragment_{kind}_{object_id}'
+    return key if version is None else f'{key}_{version}'
+
+
+def render_fragments(kind, objects, template, version=None, generations=None):
+    """Render `template` once per object, reusing cached HTML where possible
+
+    The template gets the object as `kind`. The cache key changes with
+    `version(obj)` (e.g. its updated_at) or with the cache generation in
+    `generations` (id -> generation). Generations must be read before
+    the objects are loaded, or a bump in between would store old HTML
+    under the new generation; objects without one are not cached. All
+    fragments are fetched with one cache multi-get and misses are stored
+    with one multi-set. Returns a dict of id -> Markup.
+    """
+    from app import cache
+    if not objects:
+        return {}
+
+    if generations is not None:
+        keys = [fragment_key(kind, obj.id, generations[obj.id]) if obj.id in generations else None
+                for obj in objects]
+    else:
+        keys = [fragment_key(kind, obj.id, version(obj) if version else None) for obj in objects]
+    fragments = {}
+    missing = {}
+    cached = iter(cache.get_many(*[key for key in keys if key is not None]))
+    for obj, key in zip(objects, keys):
+        html = next(cached) if key is not None else None
+        if html is None:
+            html = render_template(template, **{kind: obj})
+            if key is not None:
+                missing[key] = html
+        fragments[obj.id] = Markup(html)
+
+    if missing:
+        cache.set_many(missing, timeout=current_app.config.get('FRAGMENT_CACHE_TIMEOUT'))
+    return fragments
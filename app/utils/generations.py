@@ -0,0 +1,90 @@
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+
+def namespace_key(namespace):
+    """Get the cache key holding the generation of a namespace"""
+    return f'generation_{namespace}'
+
+
+class CacheGenerations:
+    """Generation counters for cache namespaces ('index', 'thread_1', 'user_5', ...)
+
+    Cached values embed the generations of the namespaces they depend on in
+    their key (see key()), so bumping a namespace invalidates every
+    dependent entry at once without knowing their keys. Models name the
+    namespaces that depend on them in cache_namespaces(); inserts, updates
+    and deletes of those models bump them when the session commits.
+    Generations are timestamps, so a namespace seeded after eviction is
+    always newer than anything cached before.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app.models import Category, Thread, Post, Message, User
+        for model in (Category, Thread, Post, Message, User):
+            for name in ('after_insert', 'after_update', 'after_delete'):
+                if not event.contains(model, name, self._changed):
+                    event.listen(model, name, self._changed)
+
+        for name, listener in (('after_commit', self._committed), ('after_soft_rollback', self._rolled_back)):
+            if not event.contains(Session, name, listener):
+                event.listen(Session, name, listener)
+
+    def _changed(self, mapper, connection, target):
+        self.touch(object_session(target), *target.cache_namespaces())
+
+    def _committed(self, session):
+        pending = session.info.pop('cache_generations', None)
+        if pending:
+            self.bump(*pending)
+
+    def _rolled_back(self, session, previous_transaction):
+        session.info.pop('cache_generations', None)
+
+    def touch(self, session, *namespaces):
+        """Bump namespaces when the session's transaction commits"""
+        session.info.setdefault('cache_generations', set()).update(namespaces)
+
+    def bump(self, *namespaces):
+        """Invalidate everything cached under these namespaces right away"""
+        from app import cache
+        now = time.time()
+        cache.set_many({namespace_key(namespace): now for namespace in namespaces}, timeout=0)
+
+    def current(self, *namespaces):
+        """Get the generations of the namespaces (one multi-get), seeding missing ones"""
+        from app import cache
+        generations = list(cache.get_many(*[namespace_key(namespace) for namespace in namespaces]))
+        missing = {}
+        now = time.time()
+        for i, generation in enumerate(generations):
+            if generation is None:
+                generations[i] = missing[namespace_key(namespaces[i])] = now
+        if missing:
+            cache.set_many(missing, timeout=0)
+        return generations
+
+    def wait(self, namespace, since, timeout, interval=1.0):
+        """Wait up to `timeout` seconds for the generation of a namespace to differ from `since`
+
+        Returns the generation, or None if the cache does not hold it
+        (evicted, or a NullCache), in which case waiting is pointless.
+        """
+        from app import cache
+        key = namespace_key(namespace)
+        deadline = time.monotonic() + timeout
+        while True:
+            generation = cache.get(key)
+            remaining = deadline - time.monotonic()
+            if generation is None or generation != since or remaining <= 0:
+                return generation
+            time.sleep(min(interval, remaining))
+
+    def key(self, base, *namespaces):
+        """Build a cache key that changes whenever one of the namespaces is bumped"""
+        return '_'.join([base] + [f'{generation:.6f}' for generation in self.current(*namespaces)])
@@ -0,0 +1,72 @@
+from sqlalchemy import event
+
+
+def audited_pages(app):
+    """Get the GET pages to audit, using the newest rows as sample data"""
+    from flask import url_for
+    from app.models import Category, Thread, User
+    category = Category.query.order_by(Category.id.desc()).first()
+    thread = Thread.query.filter_by(is_deleted=False).order_by(Thread.id.desc()).first()
+    user = User.query.filter_by(is_active=True).order_by(User.id.desc()).first()
+
+    with app.test_request_context():
+        pages = [url_for('forum.index')]
+        if category:
+            pages.append(url_for('forum.category', category_id=category.id))
+        if thread:
+            pages.append(url_for('forum.thread', thread_id=thread.id))
+            pages.append(url_for('forum.search', q=thread.title.split()[0]))
+        if user:
+            pages.append(url_for('forum.user_profile', username=user.username))
+            pages.append(url_for('messages.inbox'))
+            pages.append(url_for('messages.sent'))
+            pages.append(url_for('messages.conversations'))
+            pages.append(url_for('messages.compose'))
+            pages.append(url_for('messages.recipients', q=user.username[:2]))
+    return pages, user
+
+
+def capture_queries(app, pages, user=None):
+    """Request each page and collect the distinct statements it runs"""
+    from app import connection_router
+    captured = {}
+    current = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE')):
+            current.append((statement, parameters))
+
+    client = app.test_client()
+    if user is not None:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+
+    for engine in connection_router.engines:
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        for page in pages:
+            current.clear()
+            client.get(page)
+            unique = {}
+            for statement, parameters in current:
+                unique.setdefault(statement, parameters)
+            captured[page] = list(unique.items())
+    finally:
+        for engine in connection_router.engines:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return captured
+
+
+def plan_problems(connection, statement, parameters, tables):
+    """Run EXPLAIN QUERY PLAN and return full table scans and temp B-tree sorts"""
+    plan = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+    problems = []
+    for row in plan:
+        detail = row[-1]
+        words = detail.split()
+        if words[0] == 'SCAN' and words[1] in tables and 'INDEX' not in detail:
+            problems.append(detail)
+        elif 'USE TEMP B-TREE' in detail:
+            problems.append(detail)
+    return problems
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+from flask import current_app, request
+from flask_login import current_user
+from sqlalchemy import DateTime
+from app.utils.write_buffer import WriteBuffer
+
+
+class LastSeenTracker(WriteBuffer):
+    """Throttled, batched last_seen updates for logged-in users
+    
+    A request of a logged-in user is recorded in memory only if both the
+    stored and the pending last_seen are older than
+    LAST_SEEN_UPDATE_THRESHOLD seconds. Pending timestamps are written in
+    one executemany batch every LAST_SEEN_FLUSH_INTERVAL seconds, or
+    sooner once LAST_SEEN_FLUSH_USERS users are pending.
+    """
+    
+    statement = 'UPDATE users SET last_seen = :value WHERE id = :key'
+    value_type = DateTime()
+    
+    def init_app(self, app):
+        super().init_app(app)
+        self.threshold = timedelta(seconds=app.config.get('LAST_SEEN_UPDATE_THRESHOLD', 300))
+        self.interval = app.config.get('LAST_SEEN_FLUSH_INTERVAL', 60)
+        self.max_pending = app.config.get('LAST_SEEN_FLUSH_USERS', 100)
+        app.before_request(self._track_current_user)
+    
+    def merge(self, old, new):
+        return max(old, new)
+    
+    def touch(self, user):
+        """Record that a user was seen now (only if the stored or pending value is stale)"""
+        now = datetime.utcnow()
+        seen = self.pending(user.id) or user.last_seen
+        if seen is not None and now - seen < self.threshold:
+            return
+        self.add(user.id, now)
+    
+    def exempt(self, view):
+        """Don't count requests to a view as activity (e.g. background polling)"""
+        view.last_seen_exempt = True
+        return view
+    
+    def _track_current_user(self):
+        view = current_app.view_functions.get(request.endpoint)
+        if getattr(view, 'last_seen_exempt', False):
+            return
+        if current_user.is_authenticated:
+            self.touch(current_user)
@@ -0,0 +1,168 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from flask_caching.backends.base import BaseCache
+
+# Rough per-entry bookkeeping cost (dict slots, tuple, key object) added to the value size
+ENTRY_OVERHEAD = 200
+
+
+def budget_prefix(key, budgets):
+    """Get the budgeted prefix a key falls under ('' if none)"""
+    for prefix in budgets:
+        if key.startswith(prefix):
+            return prefix
+    return ''
+
+
+class MemoryCache(BaseCache):
+    """In-process LRU cache bounded by approximate memory use
+
+    Values are pickled, so their size is known. `max_size` bounds all
+    entries together; `budgets` maps key prefixes ('page_', 'fragment_',
+    'generation_', ...) to byte budgets of their own. A write evicts the
+    least recently used entries of its prefix until the prefix is within
+    budget, then the least recently used entries overall until the cache
+    is. Hits, misses and evictions are counted per prefix (see stats()).
+
+    Use CACHE_TYPE = 'app.utils.memory_cache.MemoryCache' with
+    CACHE_MAX_SIZE and CACHE_BUDGETS. Like SimpleCache it is per process.
+    """
+
+    def __init__(self, default_timeout=300, max_size=4 * 1024 * 1024, budgets=None):
+        super().__init__(default_timeout=default_timeout)
+        self.max_size = max_size
+        self.budgets = dict(budgets or {})
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires, blob, prefix)
+        self._by_prefix = {prefix: OrderedDict() for prefix in [''] + list(self.budgets)}
+        self._sizes = {prefix: 0 for prefix in self._by_prefix}
+        self._size = 0
+        self._stats = {prefix: {'hits': 0, 'misses': 0, 'evictions': 0} for prefix in self._by_prefix}
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        kwargs.update(
+            max_size=config.get('CACHE_MAX_SIZE', 4 * 1024 * 1024),
+            budgets=config.get('CACHE_BUDGETS'),
+        )
+        return cls(*args, **kwargs)
+
+    def _expires(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        return time.time() + timeout if timeout > 0 else 0
+
+    def _remove(self, key):
+        expires, blob, prefix = self._entries.pop(key)
+        del self._by_prefix[prefix][key]
+        size = len(blob) + len(key) + ENTRY_OVERHEAD
+        self._sizes[prefix] -= size
+        self._size -= size
+
+    def _evict(self, keys):
+        key = next(iter(keys))
+        self._stats[self._entries[key][2]]['evictions'] += 1
+        self._remove(key)
+
+    def _lookup(self, key, now):
+        """Get the live entry for key (or None) and count the hit or miss, lock held"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] and entry[0] <= now:
+            self._remove(key)
+            entry = None
+        stats = self._stats[budget_prefix(key, self.budgets)]
+        if entry is None:
+            stats['misses'] += 1
+            return None
+        stats['hits'] += 1
+        self._entries.move_to_end(key)
+        self._by_prefix[entry[2]].move_to_end(key)
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._lookup(key, time.time())
+        return pickle.loads(entry[1]) if entry is not None else None
+
+    def get_many(self, *keys):
+        now = time.time()
+        with self._lock:
+            entries = [self._lookup(key, now) for key in keys]
+        return [pickle.loads(entry[1]) if entry is not None else None for entry in entries]
+
+    def has(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not (entry[0] and entry[0] <= time.time())
+
+    def set(self, key, value, timeout=None):
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            return self._store(key, blob, self._expires(timeout))
+
+    def _store(self, key, blob, expires):
+        """Store a pickled value and evict down to the budgets, lock held"""
+        prefix = budget_prefix(key, self.budgets)
+        size = len(blob) + len(key) + ENTRY_OVERHEAD
+        budget = self.budgets.get(prefix, self.max_size)
+        if key in self._entries:
+            self._remove(key)
+        if size > min(budget, self.max_size):
+            return False
+
+        while self._sizes[prefix] + size > budget:
+            self._evict(self._by_prefix[prefix])
+        while self._size + size > self.max_size:
+            self._evict(self._entries)
+
+        self._entries[key] = (expires, blob, prefix)
+        self._by_prefix[prefix][key] = True
+        self._sizes[prefix] += size
+        self._size += size
+        return True
+
+    def add(self, key, value, timeout=None):
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not (entry[0] and entry[0] <= time.time()):
+                return False
+            return self._store(key, blob, self._expires(timeout))
+
+    def delete(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+        return True
+
+    def inc(self, key, delta=1):
+        with self._lock:
+            entry = self._lookup(key, time.time())
+            value = (pickle.loads(entry[1]) if entry is not None else 0) + delta
+            expires = entry[0] if entry is not None else self._expires(None)
+            self._store(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires)
+        return value
+
+    def dec(self, key, delta=1):
+        return self.inc(key, -delta)
+
+    def stats(self):
+        """Get hits, misses, evictions, entries, bytes and budget per key prefix ('' = other)"""
+        with self._lock:
+            return {
+                prefix: dict(
+                    self._stats[prefix],
+                    entries=len(self._by_prefix[prefix]),
+                    bytes=self._sizes[prefix],
+                    budget=self.budgets.get(prefix, self.max_size),
+                )
+                for prefix in self._by_prefix
+            }
@@ -0,0 +1,277 @@
+import atexit
+import bisect
+import hmac
+import os
+import sqlite3
+import threading
+import time
+from flask import Response, abort, current_app, g, has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event
+
+# Latency buckets in seconds (the +Inf bucket is implicit)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+FAMILIES = {
+    'forum_request_duration_seconds': ('histogram', 'Request latency by endpoint'),
+    'forum_requests_total': ('counter', 'Responses by endpoint and status class'),
+    'forum_db_queries_total': ('counter', 'SQL statements run by endpoint'),
+    'forum_ratelimit_rejections_total': ('counter', 'Requests rejected by the rate limiter by endpoint'),
+    'forum_cache_requests_total': ('counter', 'Cache lookups by key prefix and result'),
+    'forum_cache_evictions_total': ('counter', 'Cache entries evicted by key prefix'),
+    'forum_worker_rss_bytes': ('gauge', 'Resident memory of each worker process'),
+}
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS counters (
+        family TEXT NOT NULL,
+        name TEXT NOT NULL,
+        labels TEXT NOT NULL,
+        value REAL NOT NULL,
+        PRIMARY KEY (name, labels)
+    )""",
+    """CREATE TABLE IF NOT EXISTS gauges (
+        family TEXT NOT NULL,
+        pid INTEGER NOT NULL,
+        value REAL NOT NULL,
+        updated REAL NOT NULL,
+        PRIMARY KEY (family, pid)
+    )""",
+]
+
+
+def resident_memory():
+    """Get the resident set size of this process in bytes (None if /proc is missing)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Metrics:
+    """Prometheus text metrics, aggregated over all worker processes
+
+    Requests only update in-process counters under a lock: the latency
+    histogram and status class per endpoint, SQL statements counted by an
+    engine listener and rate limiter rejections (429). A daemon thread per
+    worker adds the changes every METRICS_FLUSH_INTERVAL seconds, together
+    with the cache backend's hit, miss and eviction counters (stats()), to
+    a SQLite file shared by the workers (METRICS_PATH, on tmpfs on the
+    router) and stores the worker's RSS. Counters of exited workers stay
+    in the file, so totals never go back.
+
+    GET /metrics renders the file. It needs `Authorization: Bearer
+    <METRICS_TOKEN>` or a logged-in admin.
+    """
+
+    def __init__(self, app=None):
+        self._app = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._local = threading.local()
+        self._histograms = {}  # endpoint -> [count per bucket..., +Inf, sum]
+        self._counters = {}  # (name, labels) -> value
+        self._cache_seen = {}  # (prefix, counter) -> value at the last flush
+        self._flusher_pid = None
+        self.enabled = False
+        self.interval = 15
+        self.buckets = DEFAULT_BUCKETS
+        self.path = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app import connection_router, last_seen_tracker, limiter
+        self._app = app
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        if not self.enabled:
+            return
+
+        self.interval = app.config.get('METRICS_FLUSH_INTERVAL', 15)
+        self.buckets = tuple(app.config.get('METRICS_BUCKETS', DEFAULT_BUCKETS))
+        self.path = app.config.get('METRICS_PATH') or os.path.join(
+            app.config.get('CACHE_DIR') or app.instance_path, 'metrics.sqlite'
+        )
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with app.app_context():
+            for engine in connection_router.engines:
+                event.listen(engine, 'after_cursor_execute', self._count_query)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        atexit.register(self._exit)
+
+        @last_seen_tracker.exempt
+        @limiter.exempt
+        def metrics():
+            """Prometheus text exposition of all workers' metrics"""
+            token = current_app.config.get('METRICS_TOKEN')
+            authorization = request.headers.get('Authorization', '')
+            if not (token and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())) and \
+                    not (current_user.is_authenticated and current_user.is_admin):
+                abort(403)
+            self.flush()
+            return Response(self.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+        app.add_url_rule('/metrics', 'metrics', metrics)
+
+    @property
+    def _connection(self):
+        # One connection per thread, reopened in forked worker processes
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=2, isolation_level=None)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = OFF')  # Losing a few counts on a crash is fine
+            for statement in SCHEMA:
+                connection.execute(statement)
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    def _start(self):
+        g._metrics_start = time.perf_counter()
+        g._metrics_queries = 0
+
+    def _count_query(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and '_metrics_queries' in g:
+            g._metrics_queries += 1
+
+    def _finish(self, response):
+        started = g.pop('_metrics_start', None)
+        queries = g.pop('_metrics_queries', 0)
+        endpoint = request.endpoint or 'unmatched'
+        status = f'{response.status_code // 100}xx'
+        with self._lock:
+            if started is not None:
+                seconds = time.perf_counter() - started
+                histogram = self._histograms.get(endpoint)
+                if histogram is None:
+                    histogram = self._histograms[endpoint] = [0] * (len(self.buckets) + 2)
+                histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+                histogram[-1] += seconds
+            self._add(('forum_requests_total', f'endpoint="{endpoint}",status="{status}"'), 1)
+            if queries:
+                self._add(('forum_db_queries_total', f'endpoint="{endpoint}"'), queries)
+            if response.status_code == 429:
+                self._add(('forum_ratelimit_rejections_total', f'endpoint="{endpoint}"'), 1)
+        if self._flusher_pid != os.getpid():
+            self._start_flusher()
+        return response
+
+    def _add(self, key, value):
+        # Lock held
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def _start_flusher(self):
+        # Threads don't survive a fork, so each worker starts its own on its first request
+        with self._flush_lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_periodically, name='metrics-flush', daemon=True).start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                self._app.logger.warning(f'Could not flush metrics: {e}')
+
+    def _exit(self):
+        # Last flush of a stopping worker; its RSS is no longer of interest
+        self.flush()
+        try:
+            self._connection.execute('DELETE FROM gauges WHERE pid = ?', (os.getpid(),))
+        except sqlite3.Error as e:
+            self._app.logger.warning(f'Could not flush metrics: {e}')
+
+    def _cache_rows(self):
+        """Get the cache counters' changes since the last flush as (family, name, labels, delta) rows"""
+        from app import cache
+        stats = getattr(cache.cache, 'stats', None)
+        if stats is None:
+            return []
+        rows = []
+        for prefix, counters in stats().items():
+            prefix = prefix or 'other'
+            for counter, name, labels in (
+                ('hits', 'forum_cache_requests_total', f'prefix="{prefix}",result="hit"'),
+                ('misses', 'forum_cache_requests_total', f'prefix="{prefix}",result="miss"'),
+                ('evictions', 'forum_cache_evictions_total', f'prefix="{prefix}"'),
+            ):
+                value = counters[counter]
+                delta = value - self._cache_seen.get((prefix, counter), 0)
+                self._cache_seen[(prefix, counter)] = value
+                if delta:
+                    rows.append((name, name, labels, delta))
+        return rows
+
+    def flush(self):
+        """Add this process's counters to the shared file and store its RSS"""
+        if not self.enabled or self._app is None:
+            return
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            histograms, self._histograms = self._histograms, {}
+            counters, self._counters = self._counters, {}
+
+        family = 'forum_request_duration_seconds'
+        rows = [(name, name, labels, value) for (name, labels), value in counters.items()]
+        for endpoint, histogram in histograms.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), histogram):
+                cumulative += count
+                rows.append((family, f'{family}_bucket', f'endpoint="{endpoint}",le="{bound}"', cumulative))
+            rows.append((family, f'{family}_sum', f'endpoint="{endpoint}"', histogram[-1]))
+            rows.append((family, f'{family}_count', f'endpoint="{endpoint}"', cumulative))
+
+        try:
+            with self._app.app_context():
+                rows += self._cache_rows()
+            rss = resident_memory()
+            connection = self._connection
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.executemany(
+                    """INSERT INTO counters (family, name, labels, value) VALUES (?, ?, ?, ?)
+                       ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value""",
+                    rows
+                )
+                if rss is not None:
+                    connection.execute(
+                        'INSERT OR REPLACE INTO gauges (family, pid, value, updated) VALUES (?, ?, ?, ?)',
+                        ('forum_worker_rss_bytes', os.getpid(), rss, time.time())
+                    )
+                # Workers that stopped reporting are gone
+                connection.execute('DELETE FROM gauges WHERE updated < ?', (time.time() - 3 * self.interval,))
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            self._app.logger.warning(f'Could not flush metrics: {e}')
+
+    def render(self):
+        """Render all workers' metrics in the Prometheus text format"""
+        connection = self._connection
+        samples = {}
+        for family, name, labels, value in connection.execute(
+                'SELECT family, name, labels, value FROM counters ORDER BY rowid'):
+            samples.setdefault(family, []).append(f'{name}{{{labels}}} {value:.15g}')
+        for family, pid, value in connection.execute(
+                'SELECT family, pid, value FROM gauges WHERE updated >= ? ORDER BY pid',
+                (time.time() - 3 * self.interval,)):
+            samples.setdefault(family, []).append(f'{family}{{pid="{pid}"}} {value:.0f}')
+
+        lines = []
+        for family, (kind, description) in FAMILIES.items():
+            if family in samples:
+                lines.append(f'# HELP {family} {description}')
+                lines.append(f'# TYPE {family} {kind}')
+                lines.extend(samples[family])
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,65 @@
+import hashlib
+from datetime import timezone
+from functools import wraps
+from flask import Response, current_app, make_response, request, session
+from flask_login import current_user
+from app.utils.generations import namespace_key
+
+
+def anonymous_page_cache(scope, last_modified, on_hit=None):
+    """Cache the whole response of a GET view for anonymous visitors
+
+    `scope(**view_args)` names the cache namespace the page shows (e.g.
+    'thread_1'). Pages are stored with the namespace's generation; when a
+    model change bumps it, every cached page of that scope is stale.
+    `last_modified(**view_args)` gets the page's Last-Modified from the
+    database when it is rendered (None skips caching, e.g. for a 404).
+    `on_hit(**view_args)` runs when a response is served without calling
+    the view.
+
+    Responses carry a strong ETag and Last-Modified, so conditional
+    requests are answered with 304. Logged-in users and visitors with
+    pending flash messages always get the view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            from app import cache, cache_generations
+            if current_user.is_authenticated or '_flashes' in session:
+                return view(**kwargs)
+
+            name = scope(**kwargs)
+            page_key = f'page_{request.full_path}'
+            generation, entry = cache.get_many(namespace_key(name), page_key)
+            if generation is None:
+                # Seeded with the current time, never from the database: pins and
+                # soft deletes leave no timestamp there, so older pages would match it
+                generation = cache_generations.current(name)[0]
+
+            if entry is not None and entry.get('generation') == generation:
+                if on_hit is not None:
+                    on_hit(**kwargs)
+                response = Response(entry['body'], mimetype=entry['mimetype'])
+            else:
+                modified = last_modified(**kwargs)
+                if modified is None:
+                    return view(**kwargs)
+                response = make_response(view(**kwargs))
+                if response.status_code != 200 or '_flashes' in session:
+                    return response
+                entry = {
+                    'generation': generation,
+                    'modified': modified.replace(tzinfo=timezone.utc),
+                    'etag': hashlib.sha1(response.get_data()).hexdigest(),
+                    'body': response.get_data(),
+                    'mimetype': response.mimetype,
+                }
+                cache.set(page_key, entry, timeout=current_app.config.get('PAGE_CACHE_TIMEOUT'))
+
+            response.set_etag(entry['etag'])
+            response.last_modified = entry['modified']
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
@@ -0,0 +1,82 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import DateTime, literal, tuple_
+
+
+class KeysetPage:
+    """One page of a keyset (seek) pagination with opaque next/prev cursors"""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def encode_cursor(values):
+    """Encode sort key values as an opaque URL-safe cursor"""
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """Decode a cursor for the given sort columns (None if it is invalid)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(columns):
+            return None
+        return [
+            datetime.fromisoformat(value) if isinstance(column.type, DateTime) else value
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_paginate(query, columns, per_page, after=None, before=None, descending=False):
+    """Get one page of a query ordered by `columns` without COUNT or OFFSET
+
+    All columns are sorted in the same direction and must form a unique key
+    (end with the primary key). `after`/`before` are cursors from a
+    previous page; without them the first page is returned. The filter is a
+    row-value comparison, so a composite index on the filter columns plus
+    `columns` turns every page into a single index range scan.
+    """
+    key = tuple_(*columns)
+    cursor = before or after
+    values = decode_cursor(cursor, columns) if cursor else None
+    backwards = values is not None and before is not None
+
+    query = query.order_by(None)
+    if values is not None:
+        bound = tuple_(*[literal(value, column.type) for column, value in zip(columns, values)])
+        query = query.filter(key < bound if descending != backwards else key > bound)
+
+    reverse = descending != backwards
+    query = query.order_by(*[column.desc() if reverse else column.asc() for column in columns])
+    items = query.limit(per_page + 1).all()
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if backwards:
+        items.reverse()
+
+    def cursor_for(item):
+        return encode_cursor([getattr(item, column.key) for column in columns])
+
+    next_cursor = prev_cursor = None
+    if items:
+        if has_more or backwards:
+            next_cursor = cursor_for(items[-1])
+        if (has_more and backwards) or (values is not None and not backwards):
+            prev_cursor = cursor_for(items[0])
+    return KeysetPage(items, per_page, next_cursor, prev_cursor)
@@ -0,0 +1,155 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import bcrypt
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Raised when too many hashes are waiting (or one waited too long)"""
+
+
+MIN_ROUNDS = 4  # bcrypt's valid cost factors
+MAX_ROUNDS = 31
+
+
+def hash_rounds(hashed):
+    """Get the cost factor of a bcrypt hash ('$2b$12$...' -> 12)"""
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """bcrypt in a small per-process thread pool
+
+    bcrypt releases the GIL, so while a login waits for its hash the
+    worker's other threads keep serving pages. At most BCRYPT_POOL_SIZE
+    hashes run at once per process, in threads with their nice value
+    raised by BCRYPT_NICE (Linux), so a burst of logins can't take all
+    of the CPU. When BCRYPT_QUEUE_LIMIT hashes are already waiting, or a
+    hash waited BCRYPT_TIMEOUT seconds, PasswordHasherBusy is raised and
+    the view turns the login away instead of piling up more.
+
+    The cost factor is BCRYPT_ROUNDS, or if that is None the highest one
+    between BCRYPT_MIN_ROUNDS and BCRYPT_MAX_ROUNDS that hashes within
+    BCRYPT_TARGET_MS on this machine. It is measured once and stored in
+    BCRYPT_ROUNDS_FILE (default: instance/bcrypt-rounds), so restarts and
+    other processes (CLI, dev server) use the same cost;
+    `flask bcrypt-calibrate` measures again. Stored hashes are only ever
+    rehashed upwards.
+    """
+
+    def __init__(self, app=None):
+        self._app = None
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self._pending = 0
+        self.rounds = 12
+        self.pool_size = 1
+        self.queue_limit = 8
+        self.timeout = 5
+        self.nice = 0
+        self.path = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        self.pool_size = app.config.get('BCRYPT_POOL_SIZE', 1)
+        self.queue_limit = app.config.get('BCRYPT_QUEUE_LIMIT', 8)
+        self.timeout = app.config.get('BCRYPT_TIMEOUT', 5)
+        self.nice = app.config.get('BCRYPT_NICE', 0)
+        self.path = app.config.get('BCRYPT_ROUNDS_FILE') or os.path.join(app.instance_path, 'bcrypt-rounds')
+        rounds = app.config.get('BCRYPT_ROUNDS')
+        if rounds is not None and not MIN_ROUNDS <= rounds <= MAX_ROUNDS:
+            raise ValueError(f'BCRYPT_ROUNDS must be from {MIN_ROUNDS} to {MAX_ROUNDS}, not {rounds}')
+        self.rounds = rounds or self.stored_rounds() or self.recalibrate()
+
+    def stored_rounds(self):
+        """Get the cost factor of an earlier calibration (None if there is none)"""
+        try:
+            with open(self.path) as f:
+                rounds = int(f.read())
+        except (OSError, ValueError):
+            return None
+        return rounds if MIN_ROUNDS <= rounds <= MAX_ROUNDS else None
+
+    def recalibrate(self):
+        """Calibrate the cost factor and store it for later starts"""
+        config = self._app.config
+        rounds = self.calibrate(config.get('BCRYPT_TARGET_MS', 250), config.get('BCRYPT_MIN_ROUNDS', 10),
+                                config.get('BCRYPT_MAX_ROUNDS', 14))
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temporary = f'{self.path}.{os.getpid()}'
+            with open(temporary, 'w') as f:
+                f.write(f'{rounds}\n')
+            os.replace(temporary, self.path)
+        except OSError as e:
+            self._app.logger.warning(f'Could not store the bcrypt cost in {self.path}: {e}')
+        return rounds
+
+    def calibrate(self, target_ms, min_rounds, max_rounds):
+        """Get the highest cost factor whose hash takes at most `target_ms` (each step doubles the time)"""
+        started = time.perf_counter()
+        bcrypt.hashpw(b'calibration', bcrypt.gensalt(min_rounds))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        rounds = min_rounds + max(math.floor(math.log2(target_ms / elapsed_ms)), 0)
+        rounds = min(rounds, max_rounds)
+        self._app.logger.info(f'bcrypt cost {rounds} (~{elapsed_ms * 2 ** (rounds - min_rounds):.0f} ms per hash)')
+        return rounds
+
+    @property
+    def _executor(self):
+        # Threads don't survive a fork, so each worker process gets its own pool
+        if self._pool_pid != os.getpid():
+            with self._lock:
+                if self._pool_pid != os.getpid():
+                    self._pool = ThreadPoolExecutor(self.pool_size, thread_name_prefix='bcrypt',
+                                                    initializer=self._lower_priority)
+                    self._pool_pid = os.getpid()
+                    self._pending = 0
+        return self._pool
+
+    def _lower_priority(self):
+        # On Linux a thread id addresses just that thread
+        if self.nice:
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+            except (AttributeError, OSError):
+                pass
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def _run(self, function, *args):
+        executor = self._executor
+        with self._lock:
+            if self._pending >= self.pool_size + self.queue_limit:
+                raise PasswordHasherBusy('Too many password hashes waiting')
+            self._pending += 1
+        future = executor.submit(function, *args)
+        future.add_done_callback(self._done)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise PasswordHasherBusy('Password hash waited too long') from None
+
+    def hash(self, password):
+        """Hash a password at the current cost factor"""
+        salt = bcrypt.gensalt(self.rounds)
+        return self._run(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def check(self, password, hashed):
+        """Check a password against a stored hash"""
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed):
+        """Check whether a stored hash was made at a lower cost factor (never downgrade)"""
+        return (hash_rounds(hashed) or 0) < self.rounds
@@ -0,0 +1,136 @@
+import random
+import re
+import time
+from collections import Counter
+from flask import g, has_app_context, request
+from markupsafe import Markup
+from sqlalchemy import event
+
+# Expanded IN lists ('IN (?, ?, ?)') and literals collapse to one statement shape
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """Normalize a statement so repeats with other parameters compare equal"""
+    shape = _IN_LIST.sub('(?)', statement)
+    shape = _LITERAL.sub('?', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+class RequestProfile:
+    """Statements run during one request with their durations"""
+
+    def __init__(self):
+        self.statements = []  # (statement, seconds)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def total(self):
+        return sum(seconds for _, seconds in self.statements)
+
+    def slowest(self, limit=3):
+        """Get the slowest statements, slowest first"""
+        return sorted(self.statements, key=lambda item: item[1], reverse=True)[:limit]
+
+    def repeated(self, threshold):
+        """Get statement shapes run at least `threshold` times (N+1 candidates)"""
+        shapes = Counter(statement_shape(statement) for statement, _ in self.statements)
+        return [(shape, count) for shape, count in shapes.most_common() if count >= threshold]
+
+
+class QueryProfiler:
+    """Per-request query count, DB time, slowest statements and N+1 patterns
+
+    Listens on all engines (writer and reader) once, from create_app. A
+    QUERY_PROFILER_SAMPLE_RATE share of requests is profiled: the response
+    gets an X-Query-Profile header, statements slower than
+    QUERY_PROFILER_SLOW seconds and statement shapes repeated at least
+    QUERY_PROFILER_REPEAT times are logged, and with QUERY_PROFILER_FOOTER
+    HTML pages get a summary before </body>.
+    """
+
+    def __init__(self, app=None):
+        self.sample_rate = 0
+        self.slow = 0.1
+        self.repeat = 5
+        self.footer = False
+        self._app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app import connection_router
+        self._app = app
+        if not app.config.get('QUERY_PROFILER', False):
+            return
+
+        self.sample_rate = app.config.get('QUERY_PROFILER_SAMPLE_RATE', 1.0)
+        self.slow = app.config.get('QUERY_PROFILER_SLOW', 0.1)
+        self.repeat = app.config.get('QUERY_PROFILER_REPEAT', 5)
+        self.footer = app.config.get('QUERY_PROFILER_FOOTER', False)
+        with app.app_context():
+            for engine in connection_router.engines:
+                event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def current(self):
+        """Get the profile of the current request (None if it is not sampled)"""
+        return g.get('_query_profile') if has_app_context() else None
+
+    def _start(self):
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            g._query_profile = RequestProfile()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.current() is not None:
+            conn.info.setdefault('query_profiler_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        profile = self.current()
+        started = conn.info.get('query_profiler_start')
+        if profile is not None and started:
+            profile.statements.append((statement, time.perf_counter() - started.pop()))
+
+    def _finish(self, response):
+        profile = g.pop('_query_profile', None)
+        if profile is None:
+            return response
+
+        repeated = profile.repeated(self.repeat)
+        response.headers['X-Query-Profile'] = (
+            f'count={profile.count}; time={profile.total * 1000:.1f}ms; repeated={len(repeated)}'
+        )
+        logger = self._app.logger
+        for statement, seconds in profile.slowest():
+            if seconds >= self.slow:
+                logger.warning(f'Slow query on {request.path} ({seconds:.3f}s): {statement}')
+        for shape, count in repeated:
+            logger.warning(f'Possible N+1 on {request.path}: {count}x {shape}')
+
+        if self.footer and response.mimetype == 'text/html' and not response.direct_passthrough:
+            body = response.get_data(as_text=True)
+            position = body.rfind('</body>')
+            if position != -1:
+                response.set_data(body[:position] + self.render_footer(profile, repeated) + body[position:])
+        return response
+
+    def render_footer(self, profile, repeated):
+        """Render the debug footer for a profiled page"""
+        rows = ''.join(
+            Markup('<li>{:.1f} ms: <code>{}</code></li>').format(seconds * 1000, statement)
+            for statement, seconds in profile.slowest()
+        )
+        rows += ''.join(
+            Markup('<li>{}x wiederholt: <code>{}</code></li>').format(count, shape)
+            for shape, count in repeated
+        )
+        return Markup(
+            '<div class="query-profile"><strong>{} Abfragen, {:.1f} ms</strong><ul>{}</ul></div>'
+        ).format(profile.count, profile.total * 1000, Markup(rows))
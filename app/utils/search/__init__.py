@@ -0,0 +1,58 @@
+import sqlite3
+from .base import SearchResults, SearchBackend
+from .like import LikeSearch
+from .fts5 import FTS5Search
+from .inverted_index import InvertedIndexSearch
+
+
+def fts5_available():
+    """Check whether the SQLite library was built with FTS5"""
+    connection = sqlite3.connect(':memory:')
+    try:
+        connection.execute('CREATE VIRTUAL TABLE fts5_check USING fts5(content)')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        connection.close()
+
+
+BACKENDS = {
+    'like': LikeSearch,
+    'fts5': FTS5Search,
+    'inverted': InvertedIndexSearch,
+}
+
+
+class SearchEngine:
+    """Forum search, backed by the engine configured in SEARCH_BACKEND
+
+    'fts5' (SQLite full-text index), 'inverted' (pure-Python inverted index
+    in ordinary tables), 'like' (table scan) or 'auto' (FTS5 if the SQLite
+    build supports it, otherwise the inverted index). Until an index has
+    been built (`flask search-rebuild`), searches fall back to the scan.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.fallback = LikeSearch()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        name = app.config.get('SEARCH_BACKEND', 'auto')
+        if name == 'auto':
+            name = 'fts5' if fts5_available() else 'inverted'
+        self.backend = BACKENDS[name]()
+        self.backend.init_app(app)
+
+    def rebuild(self):
+        self.backend.rebuild()
+
+    def search(self, query, page, per_page):
+        backend = self.backend if self.backend.is_installed() else self.fallback
+        return backend.search(query, page, per_page)
+
+
+__all__ = ['SearchEngine', 'SearchResults', 'SearchBackend',
+           'LikeSearch', 'FTS5Search', 'InvertedIndexSearch']
@@ -0,0 +1,64 @@
+import abc
+import math
+
+
+class SearchResults:
+    """One page of search results (same interface as a Flask-SQLAlchemy pagination)"""
+
+    def __init__(self, items, page, per_page, total, snippets=None):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.snippets = snippets or {}
+
+    @property
+    def pages(self):
+        return int(math.ceil(self.total / self.per_page)) if self.per_page else 0
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+
+class SearchBackend(abc.ABC):
+    """Base class for search backends"""
+
+    def init_app(self, app):
+        pass
+
+    def is_installed(self):
+        """Check whether the backend's index exists in the database"""
+        return True
+
+    def rebuild(self):
+        """Create the index if needed and refill it from threads and posts"""
+        pass
+
+    @abc.abstractmethod
+    def search(self, query, page, per_page):
+        """Search threads, best matches first (returns a pagination-like object)"""
+
+
+def load_threads(thread_ids):
+    """Load threads for a result page, keeping the given order"""
+    from sqlalchemy.orm import joinedload
+    from app.models import Thread
+    threads = Thread.query.options(
+        joinedload(Thread.author),
+        joinedload(Thread.category)
+    ).filter(Thread.id.in_(thread_ids))
+    threads = {thread.id: thread for thread in threads}
+    return [threads[thread_id] for thread_id in thread_ids if thread_id in threads]
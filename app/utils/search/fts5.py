@@ -0,0 +1,149 @@
+import re
+from markupsafe import Markup, escape
+from sqlalchemy import event, text
+from .base import SearchBackend, SearchResults, load_threads
+
+# Snippet markers, replaced by <mark> after the snippet text has been escaped
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+FTS_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS thread_search USING fts5(
+        title, tokenize = 'unicode61 remove_diacritics 2')""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS post_search USING fts5(
+        content, thread_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')""",
+
+    # Keep the index in sync with inserts, edits and soft deletes
+    """CREATE TRIGGER IF NOT EXISTS thread_search_insert AFTER INSERT ON threads
+       WHEN new.is_deleted = 0 BEGIN
+           INSERT INTO thread_search(rowid, title) VALUES (new.id, new.title);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS thread_search_update AFTER UPDATE OF title, is_deleted ON threads
+       BEGIN
+           DELETE FROM thread_search WHERE rowid = old.id;
+           INSERT INTO thread_search(rowid, title) SELECT new.id, new.title WHERE new.is_deleted = 0;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS thread_search_delete AFTER DELETE ON threads
+       BEGIN
+           DELETE FROM thread_search WHERE rowid = old.id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS post_search_insert AFTER INSERT ON posts
+       WHEN new.is_deleted = 0 BEGIN
+           INSERT INTO post_search(rowid, content, thread_id) VALUES (new.id, new.content, new.thread_id);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS post_search_update AFTER UPDATE OF content, is_deleted ON posts
+       BEGIN
+           DELETE FROM post_search WHERE rowid = old.id;
+           INSERT INTO post_search(rowid, content, thread_id)
+               SELECT new.id, new.content, new.thread_id WHERE new.is_deleted = 0;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS post_search_delete AFTER DELETE ON posts
+       BEGIN
+           DELETE FROM post_search WHERE rowid = old.id;
+       END""",
+]
+
+# Matching threads ranked by their best hit (BM25, thread titles weigh double)
+FTS_HITS = f"""
+    WITH hits AS (
+        SELECT rowid AS thread_id, bm25(thread_search) * 2.0 AS rank,
+               highlight(thread_search, 0, '{MARK_START}', '{MARK_END}') AS snippet
+        FROM thread_search WHERE thread_search MATCH :query
+        UNION ALL
+        SELECT thread_id, bm25(post_search) AS rank,
+               snippet(post_search, 0, '{MARK_START}', '{MARK_END}', '…', 16) AS snippet
+        FROM post_search WHERE post_search MATCH :query
+    )
+"""
+
+
+def highlight_snippet(snippet):
+    """Escape a snippet and turn the match markers into <mark> tags"""
+    snippet = str(escape(snippet))
+    return Markup(snippet.replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+def match_expression(query):
+    """Turn user input into a safe FTS5 query (all words, prefix match)"""
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+class FTS5Search(SearchBackend):
+    """Full-text search over thread titles and post contents (SQLite FTS5)
+
+    The index tables are created together with the models (db.create_all)
+    or by `flask search-rebuild`, and kept in sync by triggers.
+    """
+
+    def __init__(self):
+        self._installed = None
+
+    def init_app(self, app):
+        from app import db
+        for name, listener in (('after_create', self._after_create), ('after_drop', self._after_drop)):
+            if not event.contains(db.metadata, name, listener):
+                event.listen(db.metadata, name, listener)
+
+    def _after_create(self, target, connection, **kw):
+        self.install(connection)
+
+    def _after_drop(self, target, connection, **kw):
+        connection.execute(text('DROP TABLE IF EXISTS thread_search'))
+        connection.execute(text('DROP TABLE IF EXISTS post_search'))
+        self._installed = None
+
+    def install(self, connection):
+        """Create the index tables and sync triggers"""
+        for statement in FTS_SCHEMA:
+            connection.execute(text(statement))
+        self._installed = True
+
+    def is_installed(self):
+        """Check whether the index tables exist (only a yes is remembered, search-rebuild may create them later)"""
+        if not self._installed:
+            from app import db
+            row = db.session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'post_search'"
+            )).first()
+            self._installed = row is not None
+        return self._installed
+
+    def rebuild(self):
+        from app import db
+        with db.engine.begin() as conn:
+            self.install(conn)
+            conn.execute(text('DELETE FROM thread_search'))
+            conn.execute(text('DELETE FROM post_search'))
+            conn.execute(text(
+                'INSERT INTO thread_search(rowid, title) '
+                'SELECT id, title FROM threads WHERE is_deleted = 0'
+            ))
+            conn.execute(text(
+                'INSERT INTO post_search(rowid, content, thread_id) '
+                'SELECT id, content, thread_id FROM posts WHERE is_deleted = 0'
+            ))
+            conn.execute(text("INSERT INTO thread_search(thread_search) VALUES ('optimize')"))
+            conn.execute(text("INSERT INTO post_search(post_search) VALUES ('optimize')"))
+
+    def search(self, query, page, per_page):
+        from app import db
+        expression = match_expression(query)
+        if not expression:
+            return SearchResults([], page, per_page, 0)
+
+        total = db.session.execute(
+            text(FTS_HITS + 'SELECT COUNT(DISTINCT thread_id) FROM hits'),
+            {'query': expression}
+        ).scalar()
+        rows = db.session.execute(
+            text(FTS_HITS + """
+                SELECT thread_id, MIN(rank) AS best, snippet FROM hits
+                GROUP BY thread_id ORDER BY best LIMIT :limit OFFSET :offset
+            """),
+            {'query': expression, 'limit': per_page, 'offset': (page - 1) * per_page}
+        ).all()
+
+        items = load_threads([row.thread_id for row in rows])
+        snippets = {row.thread_id: highlight_snippet(row.snippet) for row in rows}
+        return SearchResults(items, page, per_page, total, snippets)
@@ -0,0 +1,209 @@
+import re
+import unicodedata
+from collections import Counter
+from sqlalchemy import event, inspect, text
+from .base import SearchBackend, SearchResults, load_threads
+
+TITLE_WEIGHT = 2
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 40
+
+# One posting per (term, thread), clustered by term so a posting list is a range scan
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS search_postings (
+        term TEXT NOT NULL,
+        thread_id INTEGER NOT NULL,
+        hits INTEGER NOT NULL,
+        PRIMARY KEY (term, thread_id)
+    ) WITHOUT ROWID""",
+    'CREATE INDEX IF NOT EXISTS idx_search_postings_thread ON search_postings (thread_id)',
+]
+
+ADD_POSTING = text("""
+    INSERT INTO search_postings (term, thread_id, hits) VALUES (:term, :thread_id, :hits)
+    ON CONFLICT (term, thread_id) DO UPDATE SET hits = hits + excluded.hits
+""")
+REMOVE_POSTING = text("""
+    UPDATE search_postings SET hits = hits - :hits WHERE term = :term AND thread_id = :thread_id
+""")
+PRUNE_POSTINGS = text('DELETE FROM search_postings WHERE thread_id = :thread_id AND hits <= 0')
+DROP_THREAD = text('DELETE FROM search_postings WHERE thread_id = :thread_id')
+POSTING_LIST = text("""
+    SELECT thread_id, SUM(hits) FROM search_postings
+    WHERE term >= :term AND term < :upper
+    GROUP BY thread_id ORDER BY thread_id
+""")
+
+
+def tokenize(content):
+    """Count the normalized terms (lowercase, no diacritics) in a text"""
+    content = unicodedata.normalize('NFKD', content or '').lower()
+    content = ''.join(char for char in content if not unicodedata.combining(char))
+    return Counter(
+        word for word in re.findall(r'\w+', content)
+        if MIN_TERM_LENGTH <= len(word) <= MAX_TERM_LENGTH
+    )
+
+
+def intersect(postings, other):
+    """Intersect two posting lists sorted by thread id, adding up the hits"""
+    result = []
+    i = j = 0
+    while i < len(postings) and j < len(other):
+        if postings[i][0] == other[j][0]:
+            result.append((postings[i][0], postings[i][1] + other[j][1]))
+            i += 1
+            j += 1
+        elif postings[i][0] < other[j][0]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+class InvertedIndexSearch(SearchBackend):
+    """Search with a token -> posting-list index in ordinary SQLite tables
+    
+    For SQLite builds without FTS5. The index is updated incrementally from
+    model events on post/thread insert and soft delete; queries intersect
+    the sorted posting lists of all search terms (prefix match).
+    """
+    
+    def __init__(self):
+        self._installed = None
+    
+    def init_app(self, app):
+        from app import db
+        from app.models import Post, Thread
+        listeners = [
+            (db.metadata, 'after_create', self._after_create),
+            (db.metadata, 'after_drop', self._after_drop),
+            (Post, 'after_insert', self._post_inserted),
+            (Post, 'after_update', self._post_updated),
+            (Thread, 'after_insert', self._thread_inserted),
+            (Thread, 'after_update', self._thread_updated),
+        ]
+        for target, name, listener in listeners:
+            if not event.contains(target, name, listener):
+                event.listen(target, name, listener)
+    
+    def _after_create(self, target, connection, **kw):
+        self.install(connection)
+    
+    def _after_drop(self, target, connection, **kw):
+        connection.execute(text('DROP TABLE IF EXISTS search_postings'))
+        self._installed = None
+    
+    def install(self, connection):
+        """Create the postings table"""
+        for statement in SCHEMA:
+            connection.execute(text(statement))
+        self._installed = True
+    
+    def is_installed(self, connection=None):
+        """Check whether the postings table exists (only a yes is remembered, search-rebuild may create it later)"""
+        if not self._installed:
+            from app import db
+            row = (connection or db.session).execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_postings'"
+            )).first()
+            self._installed = row is not None
+        return self._installed
+    
+    def add_terms(self, connection, thread_id, terms, weight=1):
+        if terms and self.is_installed(connection):
+            connection.execute(ADD_POSTING, [
+                {'term': term, 'thread_id': thread_id, 'hits': hits * weight}
+                for term, hits in terms.items()
+            ])
+    
+    def remove_terms(self, connection, thread_id, terms, weight=1):
+        if terms and self.is_installed(connection):
+            connection.execute(REMOVE_POSTING, [
+                {'term': term, 'thread_id': thread_id, 'hits': hits * weight}
+                for term, hits in terms.items()
+            ])
+            connection.execute(PRUNE_POSTINGS, {'thread_id': thread_id})
+    
+    def _post_inserted(self, mapper, connection, post):
+        if not post.is_deleted:
+            self.add_terms(connection, post.thread_id, tokenize(post.content))
+    
+    def _post_updated(self, mapper, connection, post):
+        state = inspect(post)
+        deleted = state.attrs.is_deleted.history
+        content = state.attrs.content.history
+        if deleted.has_changes():
+            if post.is_deleted:
+                old_content = content.deleted[0] if content.deleted else post.content
+                self.remove_terms(connection, post.thread_id, tokenize(old_content))
+            else:
+                self.add_terms(connection, post.thread_id, tokenize(post.content))
+        elif content.has_changes() and not post.is_deleted:
+            self.remove_terms(connection, post.thread_id, tokenize(content.deleted[0] if content.deleted else ''))
+            self.add_terms(connection, post.thread_id, tokenize(post.content))
+    
+    def _thread_inserted(self, mapper, connection, thread):
+        if not thread.is_deleted:
+            self.add_terms(connection, thread.id, tokenize(thread.title), TITLE_WEIGHT)
+    
+    def _thread_updated(self, mapper, connection, thread):
+        state = inspect(thread)
+        if state.attrs.is_deleted.history.has_changes() and thread.is_deleted:
+            # Thread.soft_delete bulk-updates its posts, so drop everything at once
+            if self.is_installed(connection):
+                connection.execute(DROP_THREAD, {'thread_id': thread.id})
+            return
+        title = state.attrs.title.history
+        if title.has_changes() and not thread.is_deleted:
+            self.remove_terms(connection, thread.id, tokenize(title.deleted[0] if title.deleted else ''), TITLE_WEIGHT)
+            self.add_terms(connection, thread.id, tokenize(thread.title), TITLE_WEIGHT)
+    
+    def rebuild(self):
+        from app import db
+        with db.engine.begin() as conn:
+            self.install(conn)
+            conn.execute(text('DELETE FROM search_postings'))
+            
+            for thread_id, title in conn.execute(text(
+                'SELECT id, title FROM threads WHERE is_deleted = 0'
+            )).all():
+                self.add_terms(conn, thread_id, tokenize(title), TITLE_WEIGHT)
+            
+            # Posts in thread order, so terms can be written per thread
+            rows = conn.execute(text("""
+                SELECT posts.thread_id, posts.content FROM posts
+                JOIN threads ON threads.id = posts.thread_id
+                WHERE posts.is_deleted = 0 AND threads.is_deleted = 0
+                ORDER BY posts.thread_id
+            """)).all()
+            current_thread, terms = None, Counter()
+            for thread_id, content in rows:
+                if thread_id != current_thread:
+                    self.add_terms(conn, current_thread, terms)
+                    current_thread, terms = thread_id, Counter()
+                terms.update(tokenize(content))
+            self.add_terms(conn, current_thread, terms)
+    
+    def search(self, query, page, per_page):
+        from app import db
+        terms = list(tokenize(query))
+        if not terms:
+            return SearchResults([], page, per_page, 0)
+        
+        # Smallest posting list first keeps the intersection cheap
+        posting_lists = sorted((
+            db.session.execute(POSTING_LIST, {'term': term, 'upper': term + '\U0010ffff'}).all()
+            for term in terms
+        ), key=len)
+        matches = posting_lists[0]
+        for postings in posting_lists[1:]:
+            if not matches:
+                break
+            matches = intersect(matches, postings)
+        
+        # Most hits first, newer threads first on ties
+        matches.sort(key=lambda match: (-match[1], -match[0]))
+        start = (page - 1) * per_page
+        thread_ids = [thread_id for thread_id, hits in matches[start:start + per_page]]
+        return SearchResults(load_threads(thread_ids), page, per_page, len(matches))
@@ -0,0 +1,21 @@
+from sqlalchemy import or_
+from .base import SearchBackend
+
+
+class LikeSearch(SearchBackend):
+    """Unindexed search: scans thread titles and post contents with LIKE"""
+    
+    def search(self, query, page, per_page):
+        from app.models import Thread, Post
+        return Thread.query.join(Post).filter(
+            Thread.is_deleted == False,
+            Post.is_deleted == False,
+            or_(
+                Thread.title.contains(query),
+                Post.content.contains(query)
+            )
+        ).distinct().paginate(
+            page=page,
+            per_page=per_page,
+            error_out=False
+        )
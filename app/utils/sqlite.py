@@ -0,0 +1,179 @@
+import threading
+import time
+from flask import has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import TextClause, create_engine, event
+
+
+def set_pragmas(pragmas):
+    """Get a connect listener that applies the given PRAGMAs to each new connection"""
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+        finally:
+            cursor.close()
+
+    return on_connect
+
+
+class SQLiteTuning:
+    """Per-connection PRAGMAs and periodic housekeeping for SQLite engines
+
+    SQLITE_PRAGMAS (journal_mode, synchronous, busy_timeout, cache_size,
+    mmap_size, temp_store, foreign_keys, ...) is applied to every new
+    connection. Every SQLITE_HOUSEKEEPING_INTERVAL seconds a request
+    teardown runs a passive WAL checkpoint and PRAGMA optimize.
+    """
+
+    def __init__(self, app=None):
+        self._app = None
+        self._last_housekeeping = time.monotonic()
+        self._housekeeping_lock = threading.Lock()
+        self.interval = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app import db
+        self._app = app
+        if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+            return
+
+        pragmas = app.config.get('SQLITE_PRAGMAS', {})
+        with app.app_context():
+            event.listen(db.engine, 'connect', set_pragmas(pragmas))
+
+        self.interval = app.config.get('SQLITE_HOUSEKEEPING_INTERVAL', 0)
+        if self.interval:
+            app.teardown_request(self._maybe_housekeeping)
+
+    def _maybe_housekeeping(self, exception=None):
+        # One thread per process does the housekeeping, the others move on
+        if not self._housekeeping_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() - self._last_housekeeping >= self.interval:
+                self._last_housekeeping = time.monotonic()
+                self.housekeeping()
+        finally:
+            self._housekeeping_lock.release()
+
+    def housekeeping(self, checkpoint='PASSIVE'):
+        """Checkpoint the WAL and let SQLite refresh its query planner statistics"""
+        from app import db
+        try:
+            with db.engine.connect() as conn:
+                conn.exec_driver_sql(f'PRAGMA wal_checkpoint({checkpoint})')
+                conn.exec_driver_sql('PRAGMA optimize')
+        except Exception as e:
+            self._app.logger.warning(f'SQLite housekeeping failed: {e}')
+
+
+def is_read(clause):
+    """Check whether a statement only reads (a SELECT or a textual SELECT/WITH query)"""
+    if clause is None:
+        return False
+    if getattr(clause, 'is_select', False):
+        return True
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip().upper().startswith(('SELECT', 'WITH'))
+    return False
+
+
+class RoutingSession(Session):
+    """Session that sends reads to the read-only pool and writes to the writer
+
+    Inside a request, SELECTs run on the reader engine until the session
+    flushes or executes a write. From then on the session is pinned to the
+    writer (so it reads its own changes) and holds the process-wide writer
+    lock until the transaction is committed, rolled back or closed.
+    """
+
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        self._writing = False
+        self._writer_lock_held = False
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        from app import connection_router
+        if bind is None and connection_router.reader is not None:
+            if self._flushing or not is_read(clause):
+                self._begin_write(connection_router)
+            elif not self._writing and has_request_context():
+                return connection_router.reader
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _begin_write(self, router):
+        if not self._writing:
+            self._writing = True
+            self._writer_lock_held = router.writer_lock.acquire(timeout=router.writer_timeout)
+
+    def _end_write(self):
+        if self._writer_lock_held:
+            self._writer_lock_held = False
+            from app import connection_router
+            connection_router.writer_lock.release()
+        self._writing = False
+
+    def commit(self):
+        try:
+            super().commit()
+        finally:
+            self._end_write()
+
+    def rollback(self):
+        try:
+            super().rollback()
+        finally:
+            self._end_write()
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._end_write()
+
+
+class ConnectionRouter:
+    """Read-only connection pool next to the default (writer) engine
+
+    The reader engine opens the same SQLite file with PRAGMA query_only, so
+    page renders never take the write lock. Writes go through db.engine and
+    are serialized per process by `writer_lock`; across worker processes
+    they queue on SQLite's busy_timeout. In-memory databases cannot be
+    shared between engines, so the split is disabled for them.
+    """
+
+    def __init__(self, app=None):
+        self.reader = None
+        self.writer_lock = threading.Lock()
+        self.writer_timeout = -1
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app import db
+        self.reader = None
+        if not app.config.get('SQLITE_READ_WRITE_SPLIT', False):
+            return
+
+        with app.app_context():
+            url = db.engine.url
+        if not url.drivername.startswith('sqlite') or url.database in (None, '', ':memory:'):
+            return
+
+        pragmas = {name: value for name, value in app.config.get('SQLITE_PRAGMAS', {}).items()
+                   if name != 'journal_mode'}
+        pragmas['query_only'] = 'ON'
+        self.reader = create_engine(url, pool_size=app.config.get('SQLITE_READER_POOL_SIZE', 5))
+        event.listen(self.reader, 'connect', set_pragmas(pragmas))
+        self.writer_timeout = app.config.get('SQLITE_WRITER_TIMEOUT', -1)
+
+    @property
+    def engines(self):
+        """All engines statements can run on (writer first)"""
+        from app import db
+        return [db.engine] + ([self.reader] if self.reader is not None else [])
@@ -0,0 +1,310 @@
+import logging
+import os
+import pickle
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from flask_caching.backends.base import BaseCache
+from app.utils.memory_cache import budget_prefix
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires REAL NOT NULL,
+        accessed REAL NOT NULL,
+        size INTEGER NOT NULL
+    )""",
+    'CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed)',
+]
+
+
+def prefix_clause(prefix):
+    """Get a WHERE clause and its parameters for the keys starting with prefix
+
+    A range on the key, so the primary key index finds them (substr() or
+    LIKE would scan the whole table).
+    """
+    if not prefix:
+        return '1', ()
+    return 'key >= ? AND key < ?', (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+class SQLiteCache(BaseCache):
+    """Cache shared by all worker processes, stored in one SQLite file (WAL mode)
+
+    Use CACHE_TYPE = 'app.utils.sqlite_cache.SQLiteCache'; the database is
+    CACHE_DIR/cache.sqlite (put CACHE_DIR on tmpfs on the router). Entries
+    expire after their timeout (0 = never). Every `cull_interval` writes
+    per process, expired entries are dropped, then the least recently used
+    ones of each prefix in `budgets` that is over its byte budget, then
+    the least recently used ones overall while more than `threshold`
+    entries or `max_size` bytes are stored. Access times are only written
+    when older than `touch_interval` seconds, so reads rarely turn into
+    writes. Hits, misses and evictions are counted per process (stats()).
+    Each process keeps at most `pool_size` connections, shared by its
+    request threads, since every connection has its own page cache.
+
+    Errors from SQLite are logged and treated as cache misses.
+    """
+
+    def __init__(self, path, default_timeout=300, threshold=2000, max_size=8 * 1024 * 1024,
+                 budgets=None, cull_interval=100, touch_interval=60, pool_size=4):
+        super().__init__(default_timeout=default_timeout)
+        self.path = path
+        self.threshold = threshold
+        self.max_size = max_size
+        self.budgets = dict(budgets or {})
+        self._stats = {prefix: {'hits': 0, 'misses': 0, 'evictions': 0}
+                       for prefix in [''] + list(self.budgets)}
+        self.cull_interval = cull_interval
+        self.touch_interval = touch_interval
+        self.pool_size = pool_size
+        self._pool_lock = threading.Lock()
+        self._pool_pid = None
+        self._idle = None
+        self._slots = None
+        self._writes = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        cache_dir = config['CACHE_DIR'] or os.path.join(app.instance_path, 'cache')
+        kwargs.update(
+            threshold=config['CACHE_THRESHOLD'],
+            max_size=config.get('CACHE_MAX_SIZE', 8 * 1024 * 1024),
+            budgets=config.get('CACHE_BUDGETS'),
+            pool_size=config.get('CACHE_POOL_SIZE', 4),
+        )
+        return cls(os.path.join(cache_dir, 'cache.sqlite'), *args, **kwargs)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=2, isolation_level=None, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute('PRAGMA synchronous = OFF')  # A lost cache is only a miss
+        for statement in SCHEMA:
+            connection.execute(statement)
+        return connection
+
+    @contextmanager
+    def _connection(self):
+        # Up to pool_size connections per process, opened on demand and reopened in forked workers
+        if self._pool_pid != os.getpid():
+            with self._pool_lock:
+                if self._pool_pid != os.getpid():
+                    self._idle = queue.LifoQueue()
+                    self._slots = threading.BoundedSemaphore(self.pool_size)
+                    self._pool_pid = os.getpid()
+        idle, slots = self._idle, self._slots
+        slots.acquire()
+        try:
+            try:
+                connection = idle.get_nowait()
+            except queue.Empty:
+                connection = self._connect()
+            try:
+                yield connection
+            finally:
+                idle.put(connection)
+        finally:
+            slots.release()
+
+    def _expires(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        return time.time() + timeout if timeout > 0 else 0
+
+    def get(self, key):
+        return self.get_many(key)[0]
+
+    def get_many(self, *keys):
+        if not keys:
+            return []
+        now = time.time()
+        found = {}
+        stale = []
+        try:
+            with self._connection() as connection:
+                rows = connection.execute(
+                    f'SELECT key, value, expires, accessed FROM cache WHERE key IN ({",".join("?" * len(keys))})',
+                    keys
+                ).fetchall()
+                for key, value, expires, accessed in rows:
+                    if expires and expires <= now:
+                        continue
+                    found[key] = pickle.loads(value)
+                    if accessed < now - self.touch_interval:
+                        stale.append((now, key))
+                if stale:
+                    connection.executemany('UPDATE cache SET accessed = ? WHERE key = ?', stale)
+        except (sqlite3.Error, pickle.UnpicklingError) as e:
+            logger.warning(f'Cache read failed: {e}')
+        for key in keys:
+            self._stats[budget_prefix(key, self.budgets)]['hits' if key in found else 'misses'] += 1
+        return [found.get(key) for key in keys]
+
+    def has(self, key):
+        try:
+            with self._connection() as connection:
+                row = connection.execute(
+                    'SELECT 1 FROM cache WHERE key = ? AND (expires = 0 OR expires > ?)', (key, time.time())
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f'Cache read failed: {e}')
+            return False
+        return row is not None
+
+    def set(self, key, value, timeout=None):
+        return self.set_many({key: value}, timeout) == [key]
+
+    def set_many(self, mapping, timeout=None):
+        now = time.time()
+        expires = self._expires(timeout)
+        rows = []
+        for key, value in mapping.items():
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            rows.append((key, blob, expires, now, len(blob)))
+        try:
+            with self._connection() as connection:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO cache (key, value, expires, accessed, size) VALUES (?, ?, ?, ?, ?)',
+                    rows
+                )
+        except sqlite3.Error as e:
+            logger.warning(f'Cache write failed: {e}')
+            return []
+        self._written(len(rows))
+        return list(mapping)
+
+    def add(self, key, value, timeout=None):
+        now = time.time()
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        try:
+            with self._connection() as connection:
+                cursor = connection.execute(
+                    """INSERT INTO cache (key, value, expires, accessed, size) VALUES (?, ?, ?, ?, ?)
+                       ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires,
+                           accessed = excluded.accessed, size = excluded.size
+                       WHERE cache.expires != 0 AND cache.expires <= ?""",
+                    (key, blob, self._expires(timeout), now, len(blob), now)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f'Cache write failed: {e}')
+            return False
+        self._written(1)
+        return cursor.rowcount > 0
+
+    def delete(self, key):
+        return self.delete_many(key) == [key]
+
+    def delete_many(self, *keys):
+        try:
+            with self._connection() as connection:
+                connection.executemany('DELETE FROM cache WHERE key = ?', [(key,) for key in keys])
+        except sqlite3.Error as e:
+            logger.warning(f'Cache delete failed: {e}')
+            return []
+        return list(keys)
+
+    def clear(self):
+        try:
+            with self._connection() as connection:
+                connection.execute('DELETE FROM cache')
+        except sqlite3.Error as e:
+            logger.warning(f'Cache clear failed: {e}')
+            return False
+        return True
+
+    def inc(self, key, delta=1):
+        try:
+            with self._connection() as connection:
+                connection.execute('BEGIN IMMEDIATE')
+                try:
+                    row = connection.execute(
+                        'SELECT value, expires FROM cache WHERE key = ? AND (expires = 0 OR expires > ?)',
+                        (key, time.time())
+                    ).fetchone()
+                    value = (pickle.loads(row[0]) if row else 0) + delta
+                    blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                    connection.execute(
+                        'INSERT OR REPLACE INTO cache (key, value, expires, accessed, size) VALUES (?, ?, ?, ?, ?)',
+                        (key, blob, row[1] if row else self._expires(None), time.time(), len(blob))
+                    )
+                    connection.execute('COMMIT')
+                except BaseException:
+                    connection.execute('ROLLBACK')
+                    raise
+        except sqlite3.Error as e:
+            logger.warning(f'Cache write failed: {e}')
+            return None
+        return value
+
+    def dec(self, key, delta=1):
+        return self.inc(key, -delta)
+
+    def _written(self, count):
+        self._writes += count
+        if self._writes >= self.cull_interval:
+            self._writes = 0
+            self.cull()
+
+    def _usage(self, connection, prefix=''):
+        where, parameters = prefix_clause(prefix)
+        return connection.execute(
+            f'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache WHERE {where}', parameters
+        ).fetchone()
+
+    def _evict_oldest(self, connection, prefix, count):
+        # Evicted keys are not returned, so they are all counted under `prefix`
+        where, parameters = prefix_clause(prefix)
+        cursor = connection.execute(
+            f'DELETE FROM cache WHERE key IN (SELECT key FROM cache WHERE {where} ORDER BY accessed LIMIT ?)',
+            parameters + (count,)
+        )
+        self._stats[prefix]['evictions'] += cursor.rowcount
+
+    def cull(self):
+        """Drop expired entries, then least recently used ones until within the limits"""
+        try:
+            with self._connection() as connection:
+                connection.execute('DELETE FROM cache WHERE expires != 0 AND expires <= ?', (time.time(),))
+                # Evict a tenth at a time, oldest access first
+                for prefix, budget in self.budgets.items():
+                    entries, size = self._usage(connection, prefix)
+                    while size > budget:
+                        self._evict_oldest(connection, prefix, max(entries // 10, 1))
+                        entries, size = self._usage(connection, prefix)
+                entries, size = self._usage(connection)
+                while entries > self.threshold or size > self.max_size:
+                    self._evict_oldest(connection, '', max(entries // 10, 1))
+                    entries, size = self._usage(connection)
+        except sqlite3.Error as e:
+            logger.warning(f'Cache cull failed: {e}')
+
+    def stats(self):
+        """Get hits, misses, evictions, entries, bytes and budget per key prefix ('' = other)
+
+        Evictions under '' are those made to keep the whole cache within
+        `threshold` and `max_size`, whatever the key.
+        """
+        try:
+            with self._connection() as connection:
+                usage = {prefix: self._usage(connection, prefix) for prefix in self.budgets}
+                entries, size = self._usage(connection)
+            usage[''] = (entries - sum(u[0] for u in usage.values()),
+                         size - sum(u[1] for u in usage.values()))
+        except sqlite3.Error as e:
+            logger.warning(f'Cache read failed: {e}')
+            usage = {}
+        return {
+            prefix: dict(
+                counters,
+                entries=usage.get(prefix, (None, None))[0],
+                bytes=usage.get(prefix, (None, None))[1],
+                budget=self.budgets.get(prefix, self.max_size),
+            )
+            for prefix, counters in self._stats.items()
+        }
@@ -0,0 +1,25 @@
+from app.utils.write_buffer import WriteBuffer
+
+
+class ViewCounter(WriteBuffer):
+    """Write-behind accumulator for thread view counts
+    
+    Page views only bump an in-process counter. Pending counts are written
+    with one `UPDATE ... SET view_count = view_count + ?` per dirty thread
+    every VIEW_COUNT_FLUSH_INTERVAL seconds, sooner once VIEW_COUNT_FLUSH_HITS
+    threads have pending views, and once more when the worker shuts down.
+    """
+    
+    statement = 'UPDATE threads SET view_count = view_count + :value WHERE id = :key'
+    
+    def init_app(self, app):
+        super().init_app(app)
+        self.interval = app.config.get('VIEW_COUNT_FLUSH_INTERVAL', 30)
+        self.max_pending = app.config.get('VIEW_COUNT_FLUSH_HITS', 50)
+    
+    def merge(self, old, new):
+        return old + new
+    
+    def increment(self, thread_id):
+        """Count one view of a thread"""
+        self.add(thread_id, 1)
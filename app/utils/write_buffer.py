@@ -0,0 +1,107 @@
+import abc
+import atexit
+import os
+import threading
+import time
+from sqlalchemy import bindparam, text
+
+
+class WriteBuffer(abc.ABC):
+    """Base class for in-process write-behind buffers
+    
+    Values are collected per key in memory and written with a single
+    executemany of `statement` (parameters :key and :value) by a
+    background thread every `interval` seconds, sooner once
+    `max_pending` keys are pending, and once more when the worker shuts down.
+    Writes hold the connection router's writer lock like any session
+    write. Subclasses define `statement`, `merge()` and how they are
+    configured in `init_app()`.
+    """
+    
+    statement = None
+    value_type = None  # SQLAlchemy type for :value, if the driver needs it
+    
+    def __init__(self, app=None):
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flusher_pid = None
+        self._app = None
+        self.interval = 30
+        self.max_pending = 50
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self._app = app
+        atexit.register(self.flush)
+    
+    @abc.abstractmethod
+    def merge(self, old, new):
+        """Combine a pending value with a new one"""
+    
+    def add(self, key, value):
+        """Buffer a value, waking the flusher when the size limit is reached"""
+        with self._lock:
+            if key in self._pending:
+                value = self.merge(self._pending[key], value)
+            self._pending[key] = value
+            due = len(self._pending) >= self.max_pending  # Distinct keys, repeats only merge
+        if self._flusher_pid != os.getpid():
+            self._start_flusher()
+        if due:
+            self._wake.set()
+    
+    def pending(self, key, default=None):
+        """Get the value not yet written for a key"""
+        return self._pending.get(key, default)
+    
+    def _start_flusher(self):
+        # Threads don't survive a fork, so each process starts its own with its first value
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_periodically, name=f'{type(self).__name__}-flush', daemon=True).start()
+    
+    def _flush_periodically(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+    
+    def flush(self):
+        """Write all pending values in one transaction"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending or self._app is None:
+            return
+        
+        from app import connection_router, db
+        statement = text(self.statement)
+        if self.value_type is not None:
+            statement = statement.bindparams(bindparam('value', type_=self.value_type))
+        # Serialized with the sessions' writes (and like them, tried anyway after SQLITE_WRITER_TIMEOUT)
+        locked = connection_router.writer_lock.acquire(timeout=connection_router.writer_timeout)
+        try:
+            with self._app.app_context(), db.engine.begin() as conn:
+                conn.execute(
+                    statement,
+                    [{'key': key, 'value': value} for key, value in pending.items()]
+                )
+        except Exception as e:
+            # Keep the values for the next attempt (e.g. database is locked)
+            self._restore(pending)
+            self._app.logger.warning(f'Could not flush {type(self).__name__}: {e}')
+        finally:
+            if locked:
+                connection_router.writer_lock.release()
+    
+    def _restore(self, pending):
+        with self._lock:
+            for key, value in pending.items():
+                if key in self._pending:
+                    value = self.merge(value, self._pending[key])
+                self._pending[key] = value
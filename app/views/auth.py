@@ -3,10 +3,16 @@ from flask_login import login_user, logout_user, current_user, login_required
 from app import db
 from app.models import User
 from app.forms import LoginForm, RegistrationForm, ResetPasswordRequestForm, ResetPasswordForm
+from app.utils import PasswordHasherBusy
 from urllib.parse import urlsplit
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+def hasher_busy(template, title, form):
+    """Turn the request away while too many passwords are being hashed"""
+    flash('Der Server ist gerade ausgelastet, bitte versuchen Sie es in ein paar Sekunden erneut.', 'error')
+    return render_template(template, title=title, form=form), 503, {'Retry-After': '5'}
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     """Handle user login"""
@@ -16,7 +22,11 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
-        if user is None or not user.check_password(form.password.data):
+        try:
+            valid = user is not None and user.check_password(form.password.data)
+        except PasswordHasherBusy:
+            return hasher_busy('auth/login.html', 'Anmelden', form)
+        if not valid:
             flash('Ungültiger Benutzername oder Passwort', 'error')
             return redirect(url_for('auth.login'))
         
@@ -24,6 +34,9 @@ def login():
             flash('Account ist deaktiviert', 'error')
             return redirect(url_for('auth.login'))
         
+        if db.session.is_modified(user):  # Password rehashed at the current cost
+            db.session.commit()
+        
         login_user(user, remember=form.remember_me.data)
         user.update_last_seen()
         
@@ -56,7 +69,10 @@ def register():
             username=form.username.data,
             email=form.email.data
         )
-        user.set_password(form.password.data)
+        try:
+            user.set_password(form.password.data)
+        except PasswordHasherBusy:
+            return hasher_busy('auth/register.html', 'Registrieren', form)
         db.session.add(user)
         db.session.commit()
         
@@ -1,37 +1,76 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_required, current_user
-from app import db, cache
+from app import db, cache_generations, search_engine, view_counter
 from app.models import Category, Thread, Post, User
 from app.forms import ThreadForm, PostForm, SearchForm
-from sqlalchemy import or_, and_
+from app.utils.pagination import keyset_paginate
+from app.utils.fragments import render_fragments
+from app.utils.page_cache import anonymous_page_cache
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload
 
 forum_bp = Blueprint('forum', __name__)
 
+def index_last_modified():
+    """Last change shown on the index page"""
+    return db.session.query(func.max(Category.last_post_at)).scalar() or datetime.utcnow()
+
+def category_last_modified(category_id):
+    """Last change shown on a category page (None if it does not exist)"""
+    row = db.session.query(Category.last_post_at, Category.created_at).filter_by(id=category_id).first()
+    return (row.last_post_at or row.created_at) if row else None
+
+def thread_last_modified(thread_id):
+    """Last change shown on a thread page (None if it does not exist)"""
+    return db.session.query(Thread.updated_at).filter_by(id=thread_id).scalar()
+
+def count_cached_view(thread_id):
+    """Count a thread view answered from the page cache"""
+    view_counter.increment(thread_id)
+
 @forum_bp.route('/')
+@anonymous_page_cache(lambda: 'index', index_last_modified)
 def index():
     """Forum index page - show all categories"""
-    categories = Category.query.filter_by(parent_id=None).all()
-    return render_template('forum/index.html', categories=categories, title='Forum')
+    # Row generations before the rows, so a bump in between can't pair old rows with the new generation
+    category_ids = [category_id for category_id, in db.session.query(Category.id).filter_by(parent_id=None)]
+    generations = dict(zip(category_ids, cache_generations.current(
+        *[f'category_{category_id}' for category_id in category_ids])))
+    categories = Category.query.options(
+        joinedload(Category.last_post).joinedload(Post.thread),
+        joinedload(Category.last_post).joinedload(Post.author),
+        selectinload(Category.subcategories)
+    ).filter_by(parent_id=None).all()
+    category_rows = render_fragments('category', categories, 'fragments/category_row.html',
+                                     generations=generations)
+    return render_template('forum/index.html',
+                         categories=categories,
+                         category_rows=category_rows,
+                         title='Forum')
 
 @forum_bp.route('/category/<int:category_id>')
+@anonymous_page_cache(lambda category_id: f'category_{category_id}', category_last_modified)
 def category(category_id):
     """Show threads in a category"""
     category = Category.query.get_or_404(category_id)
-    page = request.args.get('page', 1, type=int)
     
-    # Get threads with pagination
-    threads_query = Thread.query.filter_by(
+    # Get threads with keyset pagination (pinned first, then most recently active)
+    threads_query = Thread.query.options(
+        joinedload(Thread.author),
+        joinedload(Thread.last_post).joinedload(Post.author)
+    ).filter_by(
         category_id=category_id, 
         is_deleted=False
-    ).order_by(
-        Thread.is_pinned.desc(),
-        Thread.updated_at.desc()
     )
     
-    threads = threads_query.paginate(
-        page=page, 
+    threads = keyset_paginate(
+        threads_query,
+        [Thread.is_pinned, Thread.updated_at, Thread.id],
         per_page=current_app.config['THREADS_PER_PAGE'],
-        error_out=False
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        descending=True
     )
     
     return render_template('forum/category.html', 
@@ -67,11 +106,12 @@ def new_thread(category_id):
             author_id=current_user.id
         )
         db.session.add(post)
+        db.session.flush()  # Get post ID for the reply path
+        post.update_path()
+        category.add_thread(thread)
+        thread.add_post(post)
         db.session.commit()
         
-        # Clear category cache
-        cache.delete(f'category_thread_count_{category_id}')
-        
         flash('Thread erfolgreich erstellt!', 'success')
         return redirect(url_for('forum.thread', thread_id=thread.id))
     
@@ -81,6 +121,8 @@ def new_thread(category_id):
                          title='Neuer Thread')
 
 @forum_bp.route('/thread/<int:thread_id>')
+@anonymous_page_cache(lambda thread_id: f'thread_{thread_id}', thread_last_modified,
+                      on_hit=count_cached_view)
 def thread(thread_id):
     """Show a thread with all posts"""
     thread = Thread.query.get_or_404(thread_id)
@@ -92,29 +134,18 @@ def thread(thread_id):
     # Increment view count
     thread.increment_view_count()
     
-    page = request.args.get('page', 1, type=int)
-    
-    # Get posts with pagination
-    posts_query = Post.query.filter_by(
-        thread_id=thread_id,
-        is_deleted=False,
-        parent_id=None  # Only top-level posts
-    ).order_by(Post.created_at.asc())
-    
-    posts = posts_query.paginate(
-        page=page,
+    # Get posts with keyset pagination and their reply trees (threaded view)
+    posts, post_replies = Post.get_thread_page(
+        thread_id,
         per_page=current_app.config['POSTS_PER_PAGE'],
-        error_out=False
+        after=request.args.get('after'),
+        before=request.args.get('before')
     )
     
-    # Get replies for each post (for threaded view)
-    post_replies = {}
-    for post in posts.items:
-        replies = Post.query.filter_by(
-            parent_id=post.id,
-            is_deleted=False
-        ).order_by(Post.created_at.asc()).all()
-        post_replies[post.id] = replies
+    # Rendered post blocks come from the fragment cache (one multi-get per page)
+    all_posts = posts.items + [reply for replies in post_replies.values() for reply in replies]
+    post_fragments = render_fragments('post', all_posts, 'fragments/post.html',
+                                      version=lambda post: post.fragment_version)
     
     form = PostForm()
     
@@ -122,6 +153,7 @@ def thread(thread_id):
                          thread=thread,
                          posts=posts,
                          post_replies=post_replies,
+                         post_fragments=post_fragments,
                          form=form,
                          title=thread.title)
 
@@ -147,13 +179,11 @@ def reply(thread_id):
             author_id=current_user.id
         )
         db.session.add(post)
+        db.session.flush()  # Get post ID for the reply path
+        post.update_path()
+        thread.add_post(post)
         db.session.commit()
         
-        # Clear caches
-        cache.delete(f'thread_post_count_{thread_id}')
-        cache.delete(f'user_post_count_{current_user.id}')
-        cache.delete(f'category_post_count_{thread.category_id}')
-        
         flash('Antwort erfolgreich gepostet!', 'success')
         return redirect(url_for('forum.thread', thread_id=thread_id))
     
@@ -176,13 +206,17 @@ def reply_to_post(post_id):
     
     form = PostForm()
     if form.validate_on_submit():
+        parent_post = parent_post.reply_target()  # Deeper branches continue on the deepest level
         post = Post(
             content=form.content.data,
             thread_id=thread.id,
             author_id=current_user.id,
-            parent_id=post_id
+            parent_id=parent_post.id
         )
         db.session.add(post)
+        db.session.flush()  # Get post ID for the reply path
+        post.update_path(parent_post)
+        thread.add_post(post)
         db.session.commit()
         
         flash('Antwort erfolgreich gepostet!', 'success')
@@ -195,25 +229,18 @@ def search():
     form = SearchForm()
     results = None
     
+    # Queries come from the form (POST) or from pagination links (GET ?q=)
+    query = None
     if form.validate_on_submit():
         query = form.query.data
+    elif 3 <= len(request.args.get('q', '')) <= 100:
+        query = form.query.data = request.args['q']
+    
+    if query:
         page = request.args.get('page', 1, type=int)
+        per_page = current_app.config['THREADS_PER_PAGE']
         
-        # Search in thread titles and post content
-        threads = Thread.query.join(Post).filter(
-            Thread.is_deleted == False,
-            Post.is_deleted == False,
-            or_(
-                Thread.title.contains(query),
-                Post.content.contains(query)
-            )
-        ).distinct().paginate(
-            page=page,
-            per_page=current_app.config['THREADS_PER_PAGE'],
-            error_out=False
-        )
-        
-        results = threads
+        results = search_engine.search(query, page=page, per_page=per_page)
     
     return render_template('forum/search.html',
                          form=form,
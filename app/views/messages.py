@@ -1,22 +1,30 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+import os
+import threading
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, session, jsonify
 from flask_login import login_required, current_user
-from app import db
-from app.models import Message, User
-from app.forms import MessageForm
+from flask_caching.backends import NullCache
+from app import db, cache, cache_generations, last_seen_tracker, limiter
+from app.models import Message, User, Conversation, ConversationParticipant
+from app.forms import MessageForm, ConversationActionForm
+from app.utils.pagination import keyset_paginate
 from sqlalchemy import or_, and_
 
 messages_bp = Blueprint('messages', __name__, url_prefix='/messages')
 
+poll_slots = {}  # pid -> BoundedSemaphore, see held_poll_slots()
+poll_slots_lock = threading.Lock()
+
 @messages_bp.route('/inbox')
 @login_required
 def inbox():
     """Show user's inbox"""
-    page = request.args.get('page', 1, type=int)
-    
-    messages = Message.get_inbox(current_user.id).paginate(
-        page=page,
+    messages = keyset_paginate(
+        Message.get_inbox(current_user.id),
+        [Message.created_at, Message.id],
         per_page=current_app.config['MESSAGES_PER_PAGE'],
-        error_out=False
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        descending=True
     )
     
     return render_template('messages/inbox.html',
@@ -27,18 +35,84 @@ def inbox():
 @login_required
 def sent():
     """Show user's sent messages"""
-    page = request.args.get('page', 1, type=int)
-    
-    messages = Message.get_sent(current_user.id).paginate(
-        page=page,
+    messages = keyset_paginate(
+        Message.get_sent(current_user.id),
+        [Message.created_at, Message.id],
         per_page=current_app.config['MESSAGES_PER_PAGE'],
-        error_out=False
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        descending=True
     )
     
     return render_template('messages/sent.html',
                          messages=messages,
                          title='Gesendete Nachrichten')
 
+@messages_bp.route('/conversations')
+@login_required
+def conversations():
+    """Show user's conversations, newest activity first"""
+    conversations = keyset_paginate(
+        ConversationParticipant.get_list(current_user.id),
+        [ConversationParticipant.last_message_at, ConversationParticipant.conversation_id],
+        per_page=current_app.config['MESSAGES_PER_PAGE'],
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        descending=True
+    )
+    
+    return render_template('messages/conversations.html',
+                         conversations=conversations,
+                         form=ConversationActionForm(),
+                         title='Unterhaltungen')
+
+@messages_bp.route('/conversation/<int:conversation_id>')
+@login_required
+def conversation(conversation_id):
+    """Show the messages of a conversation and mark them as read"""
+    participant = db.session.get(ConversationParticipant, (conversation_id, current_user.id))
+    if participant is None or participant.is_deleted:
+        flash('Diese Unterhaltung existiert nicht.', 'error')
+        return redirect(url_for('messages.conversations'))
+    
+    if participant.unread_count > 0:
+        Conversation.mark_read(current_user.id, [conversation_id])
+    
+    messages = keyset_paginate(
+        Message.get_conversation(conversation_id, current_user.id),
+        [Message.created_at, Message.id],
+        per_page=current_app.config['MESSAGES_PER_PAGE'],
+        after=request.args.get('after'),
+        before=request.args.get('before')
+    )
+    
+    return render_template('messages/conversation.html',
+                         conversation=participant.conversation,
+                         messages=messages,
+                         title=participant.conversation.subject)
+
+@messages_bp.route('/conversations/mark_read', methods=['POST'])
+@login_required
+def mark_conversations_read():
+    """Mark the selected conversations as read"""
+    if not ConversationActionForm().validate_on_submit():
+        flash('Die Anfrage ist abgelaufen, bitte versuchen Sie es erneut.', 'error')
+        return redirect(url_for('messages.conversations'))
+    Conversation.mark_read(current_user.id, request.form.getlist('conversation_ids', type=int))
+    flash('Unterhaltungen als gelesen markiert.', 'success')
+    return redirect(url_for('messages.conversations'))
+
+@messages_bp.route('/conversations/delete', methods=['POST'])
+@login_required
+def delete_conversations():
+    """Delete the selected conversations for the current user"""
+    if not ConversationActionForm().validate_on_submit():
+        flash('Die Anfrage ist abgelaufen, bitte versuchen Sie es erneut.', 'error')
+        return redirect(url_for('messages.conversations'))
+    Conversation.delete_for(current_user.id, request.form.getlist('conversation_ids', type=int))
+    flash('Unterhaltungen erfolgreich gelöscht.', 'success')
+    return redirect(url_for('messages.conversations'))
+
 @messages_bp.route('/compose', methods=['GET', 'POST'])
 @login_required
 def compose():
@@ -46,21 +120,16 @@ def compose():
     form = MessageForm(current_user.id)
     
     if form.validate_on_submit():
-        message = Message(
-            subject=form.subject.data,
-            content=form.content.data,
-            sender_id=current_user.id,
-            recipient_id=form.recipient.data
+        message = Message.send(
+            current_user.id,
+            form.recipient_user.id,
+            form.subject.data,
+            form.content.data
         )
-        db.session.add(message)
         db.session.commit()
         
-        # Clear unread message cache for recipient
-        from app import cache
-        cache.delete(f'user_unread_messages_{form.recipient.data}')
-        
         flash('Nachricht erfolgreich gesendet!', 'success')
-        return redirect(url_for('messages.inbox'))
+        return redirect(url_for('messages.conversation', conversation_id=message.conversation_id))
     
     return render_template('messages/compose.html',
                          form=form,
@@ -119,36 +188,105 @@ def reply(message_id):
         flash('Sie können nur auf empfangene Nachrichten antworten.', 'error')
         return redirect(url_for('messages.inbox'))
     
-    # Pre-fill form
     form = MessageForm(current_user.id)
-    form.recipient.data = original_message.sender_id
-    form.subject.data = f"Re: {original_message.subject}"
+    if request.method == 'GET':  # Pre-fill, a POST keeps what the user edited
+        form.recipient.data = original_message.sender.username
+        form.subject.data = f"Re: {original_message.subject}"
     
     if form.validate_on_submit():
-        message = Message(
-            subject=form.subject.data,
-            content=form.content.data,
-            sender_id=current_user.id,
-            recipient_id=form.recipient.data
+        # A changed recipient starts a conversation of its own
+        same_recipient = form.recipient_user.id == original_message.sender_id
+        message = Message.send(
+            current_user.id,
+            form.recipient_user.id,
+            form.subject.data,
+            form.content.data,
+            reply_to=original_message if same_recipient else None
         )
-        db.session.add(message)
         db.session.commit()
         
-        # Clear unread message cache for recipient
-        from app import cache
-        cache.delete(f'user_unread_messages_{form.recipient.data}')
-        
         flash('Antwort erfolgreich gesendet!', 'success')
-        return redirect(url_for('messages.inbox'))
+        return redirect(url_for('messages.conversation', conversation_id=message.conversation_id))
     
     return render_template('messages/compose.html',
                          form=form,
                          title='Antwort verfassen',
                          reply_to=original_message)
 
-@messages_bp.route('/unread_count')
+@messages_bp.route('/recipients')
 @login_required
+def recipients():
+    """Get usernames starting with `q` for the recipient field (AJAX endpoint)"""
+    limit = current_app.config['RECIPIENT_SUGGESTIONS']
+    usernames = User.search_usernames(request.args.get('q', '')[:80], limit + 1)
+    response = jsonify(usernames=[name for name in usernames if name != current_user.username][:limit])
+    response.cache_control.private = True
+    response.cache_control.max_age = 60
+    return response
+
+def held_poll_slots():
+    """Get the semaphore limiting this process's held unread-count polls to MESSAGE_POLL_MAX_HELD"""
+    # Created per process, gunicorn's post_fork may lower the limit to the worker's threads
+    pid = os.getpid()
+    if pid not in poll_slots:
+        with poll_slots_lock:
+            if pid not in poll_slots:
+                poll_slots[pid] = threading.BoundedSemaphore(current_app.config['MESSAGE_POLL_MAX_HELD'])
+    return poll_slots[pid]
+
+def can_wait():
+    """Check whether unread-count requests can be held (threaded workers and a real cache)"""
+    return request.environ.get('wsgi.multithread', False) and not isinstance(cache.cache, NullCache)
+
+@messages_bp.app_template_global()
+def unread_poll():
+    """Get the inbox generation and first poll delay for the unread badge script"""
+    return {
+        'since': cache_generations.current(f'inbox_{current_user.id}')[0],
+        'delay': 0 if can_wait() else current_app.config['MESSAGE_POLL_INTERVAL'],
+    }
+
+@messages_bp.route('/unread_count')
+@last_seen_tracker.exempt
+@limiter.exempt
 def unread_count():
-    """Get unread message count (AJAX endpoint)"""
-    count = current_user.get_unread_message_count()
-    return {'unread_count': count}
\ No newline at end of file
+    """Get unread message count (AJAX endpoint, long-poll)
+    
+    `since` is the inbox generation of the previous answer. Threaded
+    workers hold the request until the generation changes or
+    MESSAGE_POLL_WAIT seconds pass; sync workers, and threaded ones
+    already holding MESSAGE_POLL_MAX_HELD polls, answer at once and send
+    the client back after MESSAGE_POLL_INTERVAL seconds. Unchanged
+    answers carry no count and need no database query, the user id is
+    read from the session. Polls don't count against the rate limit.
+    """
+    user_id = session.get('_user_id')
+    if user_id is None:
+        if not current_user.is_authenticated:
+            return current_app.login_manager.unauthorized()
+        user_id = current_user.id
+    db.session.close()  # Don't hold a connection while waiting
+    
+    config = current_app.config
+    namespace = f'inbox_{user_id}'
+    since = request.args.get('since', type=float)
+    retry = 0 if can_wait() else config['MESSAGE_POLL_INTERVAL']
+    held = retry == 0 and since is not None
+    if held and not held_poll_slots().acquire(blocking=False):
+        # Every slot is taken, keep the remaining request threads for pages
+        held, retry = False, config['MESSAGE_POLL_INTERVAL']
+    try:
+        timeout = config['MESSAGE_POLL_WAIT'] if held else 0
+        generation = cache_generations.wait(namespace, since, timeout, config['MESSAGE_POLL_CHECK_INTERVAL'])
+    finally:
+        if held:
+            held_poll_slots().release()
+    if generation is None:  # Not seeded yet, or evicted
+        generation = cache_generations.current(namespace)[0]
+    if generation == since:
+        return {'since': generation, 'retry': retry}
+    
+    user = db.session.get(User, int(user_id))
+    if user is None:
+        return current_app.login_manager.unauthorized()
+    return {'unread_count': user.get_unread_message_count(), 'since': generation, 'retry': retry}
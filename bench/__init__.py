@@ -0,0 +1,8 @@
+"""
+Benchmarks for miniForum, run offline against a generated SQLite database
+
+    python -m bench --size small --output before.json
+    python -m bench --size small --compare before.json
+
+See bench/__main__.py for the options.
+"""
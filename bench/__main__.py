@@ -0,0 +1,174 @@
+"""
+Run the benchmark flows through the Flask test client and report latency,
+queries per request and peak memory
+
+    python -m bench [--size small|medium|large] [--seed 1] [--requests 200]
+                    [--flows index,thread] [--cache null|memory|sqlite]
+                    [--reuse] [--output result.json] [--compare baseline.json]
+
+The database is generated from the size and seed (bench/data.py), so two
+runs on the same revision see the same data and the same requests.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.common import CACHE_TYPES, DEFAULT_DIR, create_benchmark_app, percentile, prepare_dataset, revision  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m bench', description='miniForum benchmarks')
+    parser.add_argument('--size', default='small', help='Dataset size: small, medium or large')
+    parser.add_argument('--seed', type=int, default=1, help='Seed for the dataset and the requests')
+    parser.add_argument('--requests', type=int, default=200, help='Timed requests per flow')
+    parser.add_argument('--warmup', type=int, default=10, help='Untimed requests per flow first')
+    parser.add_argument('--memory-requests', type=int, default=10,
+                        help='Requests per flow traced for peak memory (separately, tracing is slow)')
+    parser.add_argument('--flows', help='Comma-separated flows (default: all)')
+    parser.add_argument('--cache', choices=CACHE_TYPES, default='null', help='Cache backend')
+    parser.add_argument('--db', default=DEFAULT_DIR,
+                        help='Directory for the database and sessions')
+    parser.add_argument('--reuse', action='store_true', help='Keep the database of an earlier run with the same size and seed')
+    parser.add_argument('--output', help='Write the results as JSON')
+    parser.add_argument('--compare', help='Compare with the JSON results of an earlier run')
+    return parser.parse_args()
+
+
+def run_flow(app, name, counts, args):
+    """Drive one flow and measure it"""
+    from sqlalchemy import event
+    from app import connection_router
+    from bench.flows import FLOWS
+
+    function, login = FLOWS[name]
+    with app.app_context():
+        engines = connection_router.engines
+    rng = random.Random(f'{args.seed}-{name}')
+    client = app.test_client()
+    if login:
+        with client.session_transaction() as client_session:
+            client_session['_user_id'] = '1'
+            client_session['_fresh'] = True
+
+    queries = [0]
+
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        queries[0] += 1
+
+    def request():
+        with app.test_request_context():
+            method, url, data = function(rng, counts)
+        response = client.open(url, method=method, data=data)
+        if method == 'POST':
+            # Drop the flash message, it would pile up in the session
+            with client.session_transaction() as client_session:
+                client_session.pop('_flashes', None)
+        return response.status_code
+
+    for _ in range(args.warmup):
+        request()
+
+    latencies = []
+    errors = 0
+    for engine in engines:
+        event.listen(engine, 'after_cursor_execute', count_query)
+    try:
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            status = request()
+            latencies.append(time.perf_counter() - started)
+            errors += status >= 400
+    finally:
+        for engine in engines:
+            event.remove(engine, 'after_cursor_execute', count_query)
+
+    peak = 0
+    tracemalloc.start()
+    try:
+        for _ in range(args.memory_requests):
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            request()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'queries_per_request': round(queries[0] / len(latencies), 2),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def print_results(results, baseline=None):
+    columns = ('p50_ms', 'p95_ms', 'mean_ms', 'queries_per_request', 'peak_memory_kb')
+    print(f'{"flow":<10}' + ''.join(f'{column:>22}' for column in columns) + f'{"errors":>8}')
+    for name, flow in results['flows'].items():
+        cells = []
+        for column in columns:
+            cell = f'{flow[column]:g}'
+            before = (baseline or {}).get('flows', {}).get(name, {}).get(column)
+            if before:
+                cell += f' ({(flow[column] - before) / before * 100:+.0f}%)'
+            cells.append(f'{cell:>22}')
+        print(f'{name:<10}' + ''.join(cells) + f'{flow["errors"]:>8}')
+    print(f'RSS {results["rss_kb"]} KB')
+
+
+def main():
+    args = parse_args()
+    from bench.flows import FLOWS
+    names = args.flows.split(',') if args.flows else list(FLOWS)
+    unknown = [name for name in names if name not in FLOWS]
+    if unknown:
+        sys.exit(f'Unknown flows {", ".join(unknown)}, choose from {", ".join(FLOWS)}')
+    if args.requests < 1:
+        sys.exit('--requests must be at least 1')
+
+    app = create_benchmark_app(args)
+    from app.utils.metrics import resident_memory
+    counts, generate_seconds = prepare_dataset(app, args)
+    results = {
+        'meta': {
+            'revision': revision(),
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'size': args.size,
+            'seed': args.seed,
+            'cache': args.cache,
+            'requests': args.requests,
+        },
+        'dataset': counts,
+        'generate_seconds': round(generate_seconds, 2),
+        'flows': {name: run_flow(app, name, counts, args) for name in names},
+        'rss_kb': round((resident_memory() or 0) / 1024),  # After generating and running, for orientation
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Shared helpers: the benchmark database and result statistics
+"""
+
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+from config import BenchmarkConfig
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DIR = os.path.dirname(BenchmarkConfig.SQLALCHEMY_DATABASE_URI[len('sqlite:///'):])
+
+CACHE_TYPES = {
+    'null': 'NullCache',
+    'memory': 'app.utils.memory_cache.MemoryCache',
+    'sqlite': 'app.utils.sqlite_cache.SQLiteCache',
+}
+
+
+def percentile(values, percent):
+    """Get the nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+def revision():
+    """Get the short git revision of the tree (None outside a checkout)"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def create_benchmark_app(args):
+    """Create the app on the benchmark database with the chosen cache"""
+    os.makedirs(args.db, exist_ok=True)
+    BenchmarkConfig.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(args.db, 'forum.db')
+    BenchmarkConfig.SESSION_FILE_DIR = os.path.join(args.db, 'sessions')
+    BenchmarkConfig.CACHE_TYPE = CACHE_TYPES[args.cache]
+    BenchmarkConfig.CACHE_DIR = os.path.join(args.db, 'cache')
+    from app import create_app
+    return create_app('benchmark')
+
+
+def prepare_dataset(app, args):
+    """Generate the database, or reuse the one from an earlier run with the same size and seed"""
+    from bench.data import SIZES, generate
+    marker = os.path.join(args.db, 'dataset.json')
+    key = {'size': args.size, 'seed': args.seed}
+    if args.reuse and os.path.exists(marker):
+        with open(marker) as f:
+            stored = json.load(f)
+        if stored['key'] == key:
+            return stored['counts'], 0.0
+
+    if args.size not in SIZES:
+        sys.exit(f'Unknown size {args.size!r}, choose from {", ".join(SIZES)}')
+    started = time.perf_counter()
+    counts = generate(app, SIZES[args.size], args.seed)
+    seconds = time.perf_counter() - started
+    with open(marker, 'w') as f:
+        json.dump({'key': key, 'counts': counts}, f)
+    return counts, seconds
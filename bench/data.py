@@ -0,0 +1,180 @@
+"""
+Deterministic synthetic forum data, written with bulk inserts
+"""
+
+import random
+from datetime import datetime, timedelta
+import bcrypt
+from app import db
+from app.models import Category, Message, Post, Thread, User
+from app.models.post import path_segment
+
+# Dataset sizes; `posts` and `messages` are totals, spread unevenly over threads and conversations
+SIZES = {
+    'small': {'users': 50, 'categories': 4, 'subcategories': 2, 'threads': 200, 'posts': 2000, 'messages': 500},
+    'medium': {'users': 500, 'categories': 8, 'subcategories': 3, 'threads': 2000, 'posts': 30000, 'messages': 5000},
+    'large': {'users': 2000, 'categories': 10, 'subcategories': 4, 'threads': 10000, 'posts': 200000, 'messages': 30000},
+}
+
+PASSWORD = 'benchmark'
+MAX_REPLY_DEPTH = 6
+START = datetime(2024, 1, 1)
+
+WORDS = (
+    'router openwrt flask sqlite gunicorn python forum beitrag thema antwort frage problem '
+    'lösung speicher prozessor netzwerk wlan firmware update konfiguration server client '
+    'datenbank index abfrage cache seite benutzer nachricht kategorie ordner datei bild '
+    'karte standort wetter fahrrad garten küche urlaub musik buch film spiel verein '
+    'heute morgen gestern schnell langsam einfach schwierig neu alt groß klein gut schlecht '
+    'bitte danke hallo gruß und oder aber nicht auch noch schon immer wieder vielleicht'
+).split()
+
+BATCH_SIZE = 5000
+
+
+def words(rng, low, high):
+    """Get between `low` and `high` random vocabulary words"""
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def insert(model, rows):
+    """Insert rows in executemany batches"""
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(model.__table__.insert(), rows[start:start + BATCH_SIZE])
+
+
+def spread(rng, total, buckets, minimum=1):
+    """Split `total` into `buckets` heavy-tailed shares of at least `minimum`"""
+    weights = [rng.paretovariate(1.5) for _ in range(buckets)]
+    scale = max(total - minimum * buckets, 0) / sum(weights)
+    shares = [minimum + int(weight * scale) for weight in weights]
+    for index in range(total - sum(shares)):  # Rounding remainder
+        shares[index % buckets] += 1
+    return shares
+
+
+def generate(app, size, seed=1):
+    """Create the tables and fill them; the same size and seed give the same data
+
+    Counters, conversations and the search index are built afterwards
+    by the maintenance commands (recount, rebuild-conversations,
+    search-rebuild), as for an imported database. Returns the row counts.
+    """
+    rng = random.Random(seed)
+    # One hash for everyone at bcrypt's default cost; logins rehash it once if the calibrated cost differs
+    password_hash = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        users = [{
+            'id': user_id,
+            'username': f'user{user_id}',
+            'email': f'user{user_id}@example.org',
+            'password_hash': password_hash,
+            'bio': words(rng, 5, 20),
+            'is_active': True,
+            'is_admin': user_id == 1,
+            'created_at': START,
+            'last_seen': START,
+        } for user_id in range(1, size['users'] + 1)]
+        insert(User, users)
+
+        # Top-level categories, each with subcategories; threads go to either
+        categories = []
+        for _ in range(size['categories']):
+            parent_id = len(categories) + 1
+            categories.append({'id': parent_id, 'name': words(rng, 1, 2).title(), 'parent_id': None})
+            for _ in range(size['subcategories']):
+                categories.append({'id': len(categories) + 1, 'name': words(rng, 1, 3).title(), 'parent_id': parent_id})
+        for category in categories:
+            category.update(description=words(rng, 3, 10), is_locked=False, created_at=START)
+        insert(Category, categories)
+
+        threads = []
+        posts = []
+        post_counts = spread(rng, size['posts'], size['threads'])
+        for thread_id, post_count in enumerate(post_counts, 1):
+            created = START + timedelta(minutes=thread_id * 30)
+            author_id = rng.randint(1, size['users'])
+            # Opening post first, then replies to the thread or to an earlier post
+            thread_posts = []
+            for number in range(post_count):
+                parent = None
+                if number and rng.random() < 0.4:
+                    parent = rng.choice(thread_posts)
+                    if parent['depth'] >= MAX_REPLY_DEPTH:
+                        parent = None
+                post_id = len(posts) + 1
+                post = {
+                    'id': post_id,
+                    'content': words(rng, 5, 80),
+                    'thread_id': thread_id,
+                    'author_id': author_id if number == 0 else rng.randint(1, size['users']),
+                    'parent_id': parent['id'] if parent else None,
+                    'path': (parent['path'] if parent else '') + path_segment(post_id),
+                    'depth': parent['depth'] + 1 if parent else 0,
+                    'has_image': False,
+                    'is_deleted': False,
+                    'created_at': created + timedelta(minutes=number * 7),
+                }
+                post['updated_at'] = post['created_at']
+                thread_posts.append(post)
+                posts.append(post)
+            threads.append({
+                'id': thread_id,
+                'title': words(rng, 2, 8).capitalize(),
+                'category_id': rng.randint(1, len(categories)),
+                'author_id': author_id,
+                'is_pinned': rng.random() < 0.02,
+                'is_locked': False,
+                'is_deleted': False,
+                'view_count': rng.randint(0, 5000),
+                'created_at': created,
+                'updated_at': thread_posts[-1]['created_at'],
+            })
+        insert(Thread, threads)
+        for post in posts:
+            del post['depth']
+        insert(Post, posts)
+
+        # Dialogues of alternating messages; user1 (the benchmark login) takes part in a fifth of them
+        messages = []
+        lengths = spread(rng, size['messages'], max(size['messages'] // 4, 1))
+        for number, length in enumerate(lengths, 1):
+            first = 1 if rng.random() < 0.2 else rng.randint(1, size['users'])
+            second = rng.randint(1, size['users'] - 1)
+            second += second >= first  # Anyone but the first
+            subject = words(rng, 2, 6).capitalize()
+            sent = START + timedelta(hours=number)
+            for index in range(length):
+                sender, recipient = (first, second) if index % 2 == 0 else (second, first)
+                messages.append({
+                    'id': len(messages) + 1,
+                    'subject': subject if index == 0 else f'Re: {subject}',
+                    'content': words(rng, 5, 60),
+                    'sender_id': sender,
+                    'recipient_id': recipient,
+                    'is_read': index < length - 1 or rng.random() < 0.7,
+                    'is_deleted_by_sender': False,
+                    'is_deleted_by_recipient': False,
+                    'created_at': sent + timedelta(minutes=index * 11),
+                })
+        insert(Message, messages)
+        db.session.commit()
+
+    # Derived data is built the way existing databases get it
+    runner = app.test_cli_runner()
+    for command in ('recount', 'rebuild-conversations', 'search-rebuild'):
+        result = runner.invoke(args=[command])
+        if result.exit_code != 0:
+            raise RuntimeError(f'flask {command} failed: {result.output}') from result.exception
+
+    return {
+        'users': len(users),
+        'categories': len(categories),
+        'threads': len(threads),
+        'posts': len(posts),
+        'messages': len(messages),
+    }
@@ -0,0 +1,51 @@
+"""
+Request flows: each one picks the next request of its kind from a seeded RNG
+"""
+
+from flask import url_for
+from bench.data import WORDS
+
+# name -> (request function, logged in)
+FLOWS = {}
+
+
+def flow(name, login=False):
+    """Register a function (rng, counts) -> (method, url, form data) as a flow"""
+    def register(function):
+        FLOWS[name] = (function, login)
+        return function
+    return register
+
+
+@flow('index')
+def index(rng, counts):
+    return 'GET', url_for('forum.index'), None
+
+
+@flow('category')
+def category(rng, counts):
+    return 'GET', url_for('forum.category', category_id=rng.randint(1, counts['categories'])), None
+
+
+@flow('thread')
+def thread(rng, counts):
+    return 'GET', url_for('forum.thread', thread_id=rng.randint(1, counts['threads'])), None
+
+
+@flow('search')
+def search(rng, counts):
+    return 'GET', url_for('forum.search', q=rng.choice(WORDS)), None
+
+
+@flow('inbox', login=True)
+def inbox(rng, counts):
+    return 'GET', url_for('messages.inbox'), None
+
+
+@flow('compose', login=True)
+def compose(rng, counts):
+    return 'POST', url_for('messages.compose'), {
+        'recipient': f'user{rng.randint(2, counts["users"])}',
+        'subject': ' '.join(rng.choice(WORDS) for _ in range(3)).capitalize(),
+        'content': ' '.join(rng.choice(WORDS) for _ in range(30)),
+    }
@@ -0,0 +1,492 @@
+"""
+Load test: a mix of concurrent virtual users against a local gunicorn with
+the production config
+
+    python -m bench.load [--size small] [--users 40] [--duration 60]
+                         [--mix readers=70,posters=10,messengers=5,pollers=15]
+                         [--workers 2] [--threads 64] [--worker-class gthread|sync]
+                         [--think 1.0] [--url http://127.0.0.1:5000] [--output load.json]
+
+Readers browse index -> category -> thread anonymously, posters log in
+and reply to threads, messengers send messages and read their inbox,
+pollers hold the unread-count long-poll like the badge script. Logged-in
+users log in again every --relogin actions. gunicorn runs
+deploy/openwrt/gunicorn.conf.py on the generated database with rate
+limiting off (all virtual users share one address); --url targets a
+server that is already running instead.
+
+Reports throughput, errors, "database is locked" failures (from the
+gunicorn log) and latency percentiles per route.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.common import DEFAULT_DIR, create_benchmark_app, percentile, prepare_dataset, revision  # noqa: E402
+from bench.data import PASSWORD, words  # noqa: E402
+
+# Route labels by path, also used to attribute errors in the gunicorn log
+ROUTES = [
+    ('index', re.compile(r'^/forum/$')),
+    ('category', re.compile(r'^/forum/category/\d+$')),
+    ('thread', re.compile(r'^/forum/thread/\d+$')),
+    ('reply', re.compile(r'^/forum/thread/\d+/reply$')),
+    ('login', re.compile(r'^/auth/login$')),
+    ('logout', re.compile(r'^/auth/logout$')),
+    ('inbox', re.compile(r'^/messages/inbox$')),
+    ('compose', re.compile(r'^/messages/compose$')),
+    ('unread_count', re.compile(r'^/messages/unread_count$')),
+]
+
+CSRF_TOKEN = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+LOGGED_EXCEPTION = re.compile(r'Exception on (\S+) \[(\w+)\]')
+DEFAULT_MIX = 'readers=70,posters=10,messengers=5,pollers=15'
+
+
+def route_of(path):
+    """Get the route label of a request path (without query string)"""
+    for label, pattern in ROUTES:
+        if pattern.match(path):
+            return label
+    return 'other'
+
+
+class Recorder:
+    """Thread-safe collection of request samples, closed when the run ends"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.closed = False
+
+    def add(self, route, status, seconds):
+        with self._lock:
+            if self.closed:  # Requests still held when the run stopped don't count
+                return
+            self.latencies[route].append(seconds)
+            self.statuses[route][status] += 1
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+
+
+class Client:
+    """One virtual user's keep-alive HTTP connection with its own cookies"""
+
+    def __init__(self, host, port, recorder, timeout):
+        self.host = host
+        self.port = port
+        self.recorder = recorder
+        self.timeout = timeout
+        self.cookies = {}
+        self.connection = None
+
+    def request(self, method, path, form=None):
+        """Send a request and record it; returns (status, body), status 0 on connection errors"""
+        headers = {}
+        body = None
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        started = time.perf_counter()
+        try:
+            response = self._send(method, path, body, headers)
+            content = response.read().decode('utf-8', 'replace')
+            status = response.status
+            for cookie in response.headers.get_all('Set-Cookie') or []:
+                name, _, value = cookie.split(';', 1)[0].partition('=')
+                self.cookies[name.strip()] = value
+            if response.will_close:
+                self.close()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            status, content = 0, ''
+        self.recorder.add(route_of(path.split('?', 1)[0]), status, time.perf_counter() - started)
+        return status, content
+
+    def _send(self, method, path, body, headers):
+        # Like browsers, retry once on a new connection when the server closed an idle keep-alive one
+        reused = self.connection is not None
+        if not reused:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            return self.connection.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            self.close()
+            if not reused:
+                raise
+            return self._send(method, path, body, headers)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class VirtualUser(threading.Thread):
+    """Base class: loops over actions with think time until the deadline"""
+
+    login = False
+
+    def __init__(self, client, rng, counts, args, deadline):
+        super().__init__(daemon=True)
+        self.client = client
+        self.rng = rng
+        self.counts = counts
+        self.args = args
+        self.deadline = deadline
+        self.csrf_token = None
+
+    def running(self):
+        return time.monotonic() < self.deadline
+
+    def think(self):
+        pause = min(self.rng.expovariate(1 / self.args.think) if self.args.think else 0,
+                    max(self.deadline - time.monotonic(), 0))
+        time.sleep(pause)
+
+    def get(self, path):
+        status, body = self.client.request('GET', path)
+        match = CSRF_TOKEN.search(body)
+        if match:
+            self.csrf_token = match.group(1)
+        return status, body
+
+    def post(self, path, form):
+        return self.client.request('POST', path, dict(form, csrf_token=self.csrf_token or ''))
+
+    def sign_in(self):
+        self.client.cookies.clear()
+        self.get('/auth/login')
+        self.post('/auth/login', {'username': f'user{self.rng.randint(2, self.counts["users"])}',
+                                  'password': PASSWORD})
+
+    def run(self):
+        actions = 0
+        while self.running():
+            if self.login and actions % self.args.relogin == 0:
+                if actions:
+                    self.get('/auth/logout')
+                self.sign_in()
+            self.action()
+            actions += 1
+            self.think()
+        self.client.close()
+
+    def action(self):
+        raise NotImplementedError
+
+    def random_thread(self):
+        return f'/forum/thread/{self.rng.randint(1, self.counts["threads"])}'
+
+
+class Reader(VirtualUser):
+    """Anonymous visitor browsing index, a category and a thread"""
+
+    def action(self):
+        self.get('/forum/')
+        self.think()
+        self.get(f'/forum/category/{self.rng.randint(1, self.counts["categories"])}')
+        self.think()
+        self.get(self.random_thread())
+
+
+class Poster(VirtualUser):
+    """Logged-in user reading a thread and replying to it"""
+
+    login = True
+
+    def action(self):
+        thread = self.random_thread()
+        self.get(thread)
+        self.think()
+        self.post(f'{thread}/reply', {'content': words(self.rng, 5, 60)})
+
+
+class Messenger(VirtualUser):
+    """Logged-in user sending a message and checking the inbox"""
+
+    login = True
+
+    def action(self):
+        self.get('/messages/compose')
+        self.think()
+        self.post('/messages/compose', {
+            'recipient': f'user{self.rng.randint(1, self.counts["users"])}',
+            'subject': words(self.rng, 2, 6).capitalize(),
+            'content': words(self.rng, 5, 60),
+        })
+        self.think()
+        self.get('/messages/inbox')
+
+
+class Poller(VirtualUser):
+    """Logged-in tab holding the unread-count long-poll, like the badge script"""
+
+    login = True
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.since = None
+
+    def action(self):
+        path = '/messages/unread_count' + (f'?since={self.since}' if self.since is not None else '')
+        status, body = self.client.request('GET', path)
+        retry = 1
+        if status == 200:
+            answer = json.loads(body)
+            self.since = answer['since']
+            retry = answer['retry']
+        time.sleep(min(max(retry, 1), max(self.deadline - time.monotonic(), 0)))
+
+    def think(self):
+        pass  # The poll itself waits
+
+
+KINDS = {'readers': Reader, 'posters': Poster, 'messengers': Messenger, 'pollers': Poller}
+
+
+def parse_mix(mix, users):
+    """Split the number of virtual users by the mix weights (largest remainder)"""
+    weights = {}
+    for part in mix.split(','):
+        kind, _, weight = part.partition('=')
+        if kind not in KINDS:
+            sys.exit(f'Unknown user kind {kind!r}, choose from {", ".join(KINDS)}')
+        weights[kind] = float(weight)
+    total = sum(weights.values())
+    shares = {kind: users * weight / total for kind, weight in weights.items()}
+    numbers = {kind: int(share) for kind, share in shares.items()}
+    for kind in sorted(shares, key=lambda kind: shares[kind] - numbers[kind], reverse=True)[:users - sum(numbers.values())]:
+        numbers[kind] += 1
+    return numbers
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_gunicorn(args, port, log_path):
+    """Start gunicorn with the production config on the benchmark database and wait until it answers"""
+    cache_dir = os.path.join(args.db, 'cache')
+    shutil.rmtree(cache_dir, ignore_errors=True)  # Cached pages of an earlier dataset
+    threads = 1 if args.worker_class == 'sync' else args.threads  # gunicorn turns sync + threads into gthread
+    env = dict(
+        os.environ,
+        FLASK_CONFIG='production',
+        SECRET_KEY='load-test',
+        DATABASE_URL='sqlite:///' + os.path.join(args.db, 'forum.db'),
+        CACHE_DIR=cache_dir,
+        GUNICORN_BIND=f'127.0.0.1:{port}',
+        RATELIMIT_ENABLED='false',
+        BCRYPT_ROUNDS_FILE=os.path.join(args.db, 'bcrypt-rounds'),  # Not into the checkout's instance folder
+        # Working directory for the session files, so they stay out of the checkout
+        GUNICORN_CMD_ARGS=f'--workers {args.workers} --threads {threads} --worker-class {args.worker_class} '
+                          f'--chdir {args.db}',
+    )
+    log = open(log_path, 'w')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'deploy', 'openwrt', 'gunicorn.conf.py'), 'run:app'],
+        env=env, stdout=log, stderr=subprocess.STDOUT, start_new_session=True  # Own process group, see stop_gunicorn()
+    )
+    log.close()
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/forum/')
+            if connection.getresponse().status == 200:
+                return process
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.2)
+    stop_gunicorn(process)
+    with open(log_path) as f:
+        sys.exit('gunicorn did not come up:\n' + f.read()[-3000:])
+
+
+def stop_gunicorn(process):
+    # Quick shutdown of master and workers; workers still holding long-polls are killed after a few seconds
+    try:
+        os.killpg(process.pid, signal.SIGINT)
+        process.wait(timeout=10)
+    except ProcessLookupError:
+        return
+    except subprocess.TimeoutExpired:
+        pass
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+def locked_errors(log_path):
+    """Count logged "database is locked" exceptions per route"""
+    counts = defaultdict(int)
+    with open(log_path, errors='replace') as f:
+        # Each logged exception starts with "Exception on <path> [<method>]", its traceback follows
+        blocks = LOGGED_EXCEPTION.split(f.read())
+    for index in range(1, len(blocks) - 2, 3):
+        path, traceback = blocks[index], blocks[index + 2]
+        if 'database is locked' in traceback:
+            counts[route_of(path)] += 1
+    return counts
+
+
+def summarize(recorder, elapsed, locked):
+    routes = {}
+    for route in sorted(recorder.latencies):
+        latencies = recorder.latencies[route]
+        statuses = recorder.statuses[route]
+        errors = sum(count for status, count in statuses.items() if status == 0 or status >= 500)
+        routes[route] = {
+            'requests': len(latencies),
+            'rps': round(len(latencies) / elapsed, 2),
+            'errors': errors,
+            'locked': locked.get(route, 0),
+            'statuses': {str(status): count for status, count in sorted(statuses.items())},
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+            'max_ms': round(max(latencies) * 1000, 1),
+        }
+    requests = sum(route['requests'] for route in routes.values())
+    errors = sum(route['errors'] for route in routes.values())
+    return {
+        'requests': requests,
+        'rps': round(requests / elapsed, 2),
+        'error_rate': round(errors / requests, 4) if requests else 0,
+        'locked': sum(locked.values()),
+        'routes': routes,
+    }
+
+
+def print_summary(summary):
+    columns = ('requests', 'rps', 'errors', 'locked', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')
+    print(f'{"route":<14}' + ''.join(f'{column:>10}' for column in columns))
+    for route, stats in summary['routes'].items():
+        print(f'{route:<14}' + ''.join(f'{stats[column]:>10g}' for column in columns))
+    print(f'{summary["requests"]} requests, {summary["rps"]} req/s, '
+          f'error rate {summary["error_rate"]:.2%}, {summary["locked"]} "database is locked"')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m bench.load', description='miniForum load test')
+    parser.add_argument('--size', default='small', help='Dataset size: small, medium or large')
+    parser.add_argument('--seed', type=int, default=1, help='Seed for the dataset and the virtual users')
+    parser.add_argument('--users', type=int, default=40, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds of load')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Share of each kind of virtual user')
+    parser.add_argument('--think', type=float, default=1.0, help='Mean seconds between actions (0: none)')
+    parser.add_argument('--relogin', type=int, default=20, help='Actions of a logged-in user between logins')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=64, help='Threads per gthread worker')
+    parser.add_argument('--worker-class', choices=['gthread', 'sync'], default='gthread')
+    parser.add_argument('--db', default=os.path.join(DEFAULT_DIR, 'load'), help='Directory for the database and logs')
+    parser.add_argument('--reuse', action='store_true', help='Keep the database of an earlier run with the same size and seed')
+    parser.add_argument('--url', help='Load an already running server instead of starting gunicorn')
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+    args.cache = 'null'
+    if args.relogin < 1:
+        parser.error('--relogin must be at least 1')
+    return args
+
+
+def main():
+    args = parse_args()
+    numbers = parse_mix(args.mix, args.users)
+    process = None
+    log_path = os.path.join(args.db, 'gunicorn.log')
+    if args.url:
+        target = urlsplit(args.url)
+        host, port = target.hostname, target.port or 80
+        counts = None
+    else:
+        app = create_benchmark_app(args)
+        counts, _ = prepare_dataset(app, args)
+        host, port = '127.0.0.1', free_port()
+        process = start_gunicorn(args, port, log_path)
+    if counts is None:
+        # Without the dataset, stay within the ids every generated size has
+        from bench.data import SIZES
+        counts = {'users': SIZES['small']['users'], 'threads': SIZES['small']['threads'],
+                  'categories': SIZES['small']['categories'] * (SIZES['small']['subcategories'] + 1)}
+
+    recorder = Recorder()
+    started = time.monotonic()
+    deadline = started + args.duration
+    users = []
+    index = 0
+    for kind, number in numbers.items():
+        for _ in range(number):
+            rng = random.Random(f'{args.seed}-{index}')
+            client = Client(host, port, recorder, timeout=90)  # Longer than a held long-poll
+            users.append(KINDS[kind](client, rng, counts, args, deadline))
+            index += 1
+    try:
+        for user in users:
+            user.start()
+        for user in users:
+            if not isinstance(user, Poller):
+                user.join(timeout=max(deadline - time.monotonic(), 0) + 30)
+    finally:
+        recorder.close()
+        elapsed = time.monotonic() - started
+        if process is not None:
+            stop_gunicorn(process)
+
+    locked = locked_errors(log_path) if process is not None else {}
+    summary = summarize(recorder, elapsed, locked)
+    print(f'{args.users} users ({", ".join(f"{number} {kind}" for kind, number in numbers.items())}), '
+          f'{elapsed:.0f}s, ' + (f'{args.workers} {args.worker_class} workers' if process else args.url))
+    print_summary(summary)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'revision': revision(),
+                    'size': args.size,
+                    'seed': args.seed,
+                    'users': numbers,
+                    'duration': round(elapsed, 1),
+                    'think': args.think,
+                    'workers': args.workers,
+                    'worker_class': args.worker_class,
+                    'threads': args.threads if args.worker_class == 'gthread' else 1,
+                    'url': args.url,
+                },
+                'summary': summary,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
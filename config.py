@@ -1,6 +1,24 @@
 import os
+import tempfile
+import warnings
 from datetime import timedelta
 
+
+def bcrypt_rounds_from_env():
+    """Get BCRYPT_ROUNDS from the environment (None if unset or not a bcrypt cost of 4-31)"""
+    value = os.environ.get('BCRYPT_ROUNDS', '').strip()
+    if not value:
+        return None
+    try:
+        rounds = int(value)
+    except ValueError:
+        rounds = None
+    if rounds is None or not 4 <= rounds <= 31:
+        warnings.warn(f'Ignoring BCRYPT_ROUNDS={value!r}, expected a number from 4 to 31')
+        return None
+    return rounds
+
+
 class Config:
     """Base configuration"""
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
@@ -10,6 +28,23 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = False  # Set to True in development for query logging
     
+    # SQLite tuning, applied to every new connection
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',  # Readers no longer block behind writers
+        'synchronous': 'NORMAL',  # Safe with WAL, far fewer fsyncs
+        'busy_timeout': 5000,  # Wait up to 5s for the write lock instead of failing
+        'cache_size': -4000,  # 4 MB page cache per connection
+        'mmap_size': 16 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'foreign_keys': 'ON',
+    }
+    SQLITE_HOUSEKEEPING_INTERVAL = 600  # WAL checkpoint + PRAGMA optimize every 10 minutes
+    
+    # Reads use a separate query_only pool, writes one serialized writer per process
+    SQLITE_READ_WRITE_SPLIT = True
+    SQLITE_READER_POOL_SIZE = 5
+    SQLITE_WRITER_TIMEOUT = 10  # Seconds to wait for the writer before trying anyway
+    
     # File upload configuration
     UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'app/static/uploads')
     MAX_CONTENT_LENGTH = 500 * 1024  # 500KB max file size
@@ -27,11 +62,38 @@ class Config:
     WTF_CSRF_ENABLED = True
     WTF_CSRF_TIME_LIMIT = 3600  # 1 hour
     
-    # Performance
-    CACHE_TYPE = 'SimpleCache'
-    CACHE_DEFAULT_TIMEOUT = 300  # 5 minutes
-    
-    # Rate limiting
+    # Performance: one cache shared by all workers (SQLite file, best kept on tmpfs)
+    CACHE_TYPE = 'app.utils.sqlite_cache.SQLiteCache'
+    CACHE_DIR = os.environ.get('CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'miniforum-cache')
+    CACHE_THRESHOLD = 2000  # Entries before least recently used ones are evicted
+    CACHE_MAX_SIZE = 8 * 1024 * 1024  # Bytes of pickled values before eviction
+    CACHE_POOL_SIZE = 4  # SQLite cache connections per worker, shared by its threads
+    CACHE_BUDGETS = {  # Byte budgets per key prefix, least recently used evicted first
+        'page_': 4 * 1024 * 1024,  # Full pages for anonymous visitors
+        'fragment_': 3 * 1024 * 1024,  # Rendered post blocks and category rows
+        'generation_': 256 * 1024,  # Generation counters (evicting one only costs misses)
+        'user_': 256 * 1024,  # Per-user counters
+    }
+    # Keys embed generation counters that model changes bump (app/utils/generations.py),
+    # so timeouts only bound memory use, not staleness
+    CACHE_DEFAULT_TIMEOUT = 3600  # 1 hour
+    FRAGMENT_CACHE_TIMEOUT = 86400  # Rendered post blocks and category rows
+    PAGE_CACHE_TIMEOUT = 3600  # Full pages for anonymous visitors (index, category, thread)
+    
+    # Buffered view counter (written every N seconds or N views)
+    VIEW_COUNT_FLUSH_INTERVAL = 30
+    VIEW_COUNT_FLUSH_HITS = 50  # Threads with pending views before an early flush
+    
+    # Throttled last_seen tracking (only written when older than the threshold)
+    LAST_SEEN_UPDATE_THRESHOLD = 300  # 5 minutes
+    LAST_SEEN_FLUSH_INTERVAL = 60
+    LAST_SEEN_FLUSH_USERS = 100  # Users with a pending timestamp before an early flush
+    
+    # Search backend: 'fts5', 'inverted' (for SQLite builds without FTS5), 'like' or 'auto'
+    SEARCH_BACKEND = 'auto'
+    
+    # Rate limiting (RATELIMIT_ENABLED=false for load tests, where all clients share one address)
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() != 'false'
     RATELIMIT_STORAGE_URL = "memory://"
     RATELIMIT_STRATEGY = "moving-window"
     
@@ -39,6 +101,37 @@ class Config:
     POSTS_PER_PAGE = 15
     THREADS_PER_PAGE = 20
     MESSAGES_PER_PAGE = 20
+    RECIPIENT_SUGGESTIONS = 10  # Usernames offered while typing a recipient
+    
+    # Unread badge: long-poll on threaded workers, plain polling on sync workers
+    MESSAGE_POLL_WAIT = 55  # Seconds a request is held (below common 60s proxy timeouts)
+    MESSAGE_POLL_CHECK_INTERVAL = 1  # Seconds between cache checks while holding
+    MESSAGE_POLL_INTERVAL = 120  # Seconds between polls on sync workers (and when all slots are held)
+    MESSAGE_POLL_MAX_HELD = 16  # Polls held at once per process, each one occupies a request thread
+    
+    # Query profiler: count, DB time, slow statements and N+1 patterns per request
+    QUERY_PROFILER = False
+    QUERY_PROFILER_SAMPLE_RATE = 1.0  # Share of requests profiled
+    QUERY_PROFILER_SLOW = 0.1  # Seconds; slower statements are logged
+    QUERY_PROFILER_REPEAT = 5  # Statement shapes run this often in one request are logged as N+1
+    QUERY_PROFILER_FOOTER = False  # Summary at the end of HTML pages
+    
+    # Metrics on /metrics (Prometheus text format), summed over all workers in one SQLite file
+    METRICS_ENABLED = True
+    METRICS_PATH = None  # Default: CACHE_DIR/metrics.sqlite
+    METRICS_FLUSH_INTERVAL = 15  # Seconds between a worker's writes to the file
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Bearer token for scrapers; admins can always read
+    
+    # Password hashing (bcrypt) in a small thread pool per worker
+    BCRYPT_ROUNDS = bcrypt_rounds_from_env()  # None: calibrated once, see BCRYPT_ROUNDS_FILE
+    BCRYPT_ROUNDS_FILE = os.environ.get('BCRYPT_ROUNDS_FILE')  # Calibrated cost; default: instance/bcrypt-rounds
+    BCRYPT_TARGET_MS = 250  # Calibration: highest cost whose hash takes at most this long
+    BCRYPT_MIN_ROUNDS = 10
+    BCRYPT_MAX_ROUNDS = 14
+    BCRYPT_POOL_SIZE = 1  # Hashes running at once per worker
+    BCRYPT_QUEUE_LIMIT = 8  # Hashes waiting per worker before logins get a 503
+    BCRYPT_TIMEOUT = 5  # Seconds a hash may wait and run before the login gets a 503
+    BCRYPT_NICE = 5  # Lower priority of the hashing threads (Linux), pages are served first
     
     # Application settings
     FORUM_NAME = 'miniForum'
@@ -49,6 +142,8 @@ class DevelopmentConfig(Config):
     DEBUG = True
     SQLALCHEMY_ECHO = True  # Log all database queries
     CACHE_TYPE = 'NullCache'  # Disable caching in development
+    QUERY_PROFILER = True
+    QUERY_PROFILER_FOOTER = True
     SESSION_COOKIE_SECURE = False
     
     # Development rate limits (more generous)
@@ -63,8 +158,10 @@ class ProductionConfig(Config):
     # Use environment variable for secret key in production
     SECRET_KEY = os.environ.get('SECRET_KEY')
     
-    # SQLite optimization for embedded systems
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///forum.db?cache=shared&mode=rwc'
+    # SQLite optimization for embedded systems (WAL mode, no shared cache)
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///forum.db'
+    SQLITE_PRAGMAS = dict(Config.SQLITE_PRAGMAS, cache_size=-2000, mmap_size=32 * 1024 * 1024)
+    SQLITE_READER_POOL_SIZE = 2
     
     # Stricter rate limiting for production
     RATELIMIT_DEFAULT = "30 per minute"
@@ -75,18 +172,40 @@ class ProductionConfig(Config):
     SESSION_COOKIE_SECURE = True  # Requires HTTPS
     SESSION_COOKIE_HTTPONLY = True
     
-    # Production caching
-    CACHE_TYPE = 'SimpleCache'
-    CACHE_DEFAULT_TIMEOUT = 600  # 10 minutes
+    # Production caching (shared between the Gunicorn workers)
+    CACHE_TYPE = 'app.utils.sqlite_cache.SQLiteCache'
+    CACHE_MAX_SIZE = 4 * 1024 * 1024
+    CACHE_BUDGETS = {
+        'page_': 2 * 1024 * 1024,
+        'fragment_': 1536 * 1024,
+        'generation_': 128 * 1024,
+        'user_': 128 * 1024,
+    }
+    CACHE_DEFAULT_TIMEOUT = 6 * 3600  # 6 hours
+    
+    # Fewer view counter writes
+    VIEW_COUNT_FLUSH_INTERVAL = 60
+    VIEW_COUNT_FLUSH_HITS = 200
     
     # Logging
     LOG_LEVEL = 'WARNING'  # Minimal logging for resource conservation
+    QUERY_PROFILER_SAMPLE_RATE = 0.01  # If QUERY_PROFILER is switched on
     
-    # Gunicorn settings (will be used in deployment)
+    # Gunicorn settings (read by deploy/openwrt/gunicorn.conf.py)
+    GUNICORN_BIND = '127.0.0.1:5000'  # Behind the Apache reverse proxy
     GUNICORN_WORKERS = 2  # Minimal workers for embedded systems
-    GUNICORN_THREADS = 1  # Single thread per worker
-    GUNICORN_WORKER_CLASS = 'sync'  # Simple sync worker for low memory
+    # Threaded workers: idle keep-alive connections wait in a selector, threads
+    # are only started on demand for requests (long-polls included)
+    GUNICORN_WORKER_CLASS = 'gthread'
+    GUNICORN_THREADS = 64  # Concurrent requests per worker
+    # Held unread-count polls per worker: 16 tabs get instant badge updates, the
+    # other 48 threads stay free for pages (gunicorn.conf.py caps it at a quarter of --threads)
+    MESSAGE_POLL_MAX_HELD = GUNICORN_THREADS // 4
+    GUNICORN_WORKER_CONNECTIONS = 500  # Open connections per worker
+    GUNICORN_THREAD_STACK_SIZE = 512 * 1024  # Bytes; musl's (OpenWRT) 128 KB default is too small for rendering
+    GUNICORN_KEEPALIVE = 5
     GUNICORN_WORKER_TIMEOUT = 30
+    GUNICORN_GRACEFUL_TIMEOUT = Config.MESSAGE_POLL_WAIT + 5  # Let held long-polls finish
     GUNICORN_MAX_REQUESTS = 1000  # Restart workers after 1000 requests
     GUNICORN_MAX_REQUESTS_JITTER = 50
 
@@ -96,11 +215,29 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
     CACHE_TYPE = 'NullCache'
+    METRICS_ENABLED = False
+    BCRYPT_ROUNDS = 4  # Fast hashes, no calibration
+
+class BenchmarkConfig(Config):
+    """Benchmark configuration (bench/), production SQLite settings on a generated database"""
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'miniforum-bench', 'forum.db')
+    SQLITE_PRAGMAS = ProductionConfig.SQLITE_PRAGMAS
+    SQLITE_READER_POOL_SIZE = ProductionConfig.SQLITE_READER_POOL_SIZE
+    SQLITE_HOUSEKEEPING_INTERVAL = 0  # No checkpoints in the middle of a measurement
+    SESSION_FILE_DIR = os.path.join(tempfile.gettempdir(), 'miniforum-bench', 'sessions')
+    BCRYPT_ROUNDS_FILE = os.path.join(tempfile.gettempdir(), 'miniforum-bench', 'bcrypt-rounds')
+    WTF_CSRF_ENABLED = False
+    RATELIMIT_ENABLED = False
+    CACHE_TYPE = 'NullCache'  # Measure the views, not the cache (bench --cache to change)
+    METRICS_ENABLED = False
+    VIEW_COUNT_FLUSH_INTERVAL = ProductionConfig.VIEW_COUNT_FLUSH_INTERVAL
+    VIEW_COUNT_FLUSH_HITS = ProductionConfig.VIEW_COUNT_FLUSH_HITS
 
 # Configuration dictionary
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
     'testing': TestingConfig,
+    'benchmark': BenchmarkConfig,
     'default': DevelopmentConfig
 }
\ No newline at end of file
@@ -0,0 +1,49 @@
+"""Gunicorn configuration for miniForum on OpenWRT
+
+    gunicorn -c deploy/openwrt/gunicorn.conf.py run:app
+
+Settings come from the GUNICORN_* values of ProductionConfig; single
+values can be overridden with GUNICORN_CMD_ARGS (e.g. "--threads 16").
+The app is loaded once in the master and shared copy-on-write by the
+workers, which drop the inherited database connections after forking.
+"""
+import os
+import sys
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('FLASK_CONFIG', 'production')
+
+from config import ProductionConfig as settings  # noqa: E402
+
+chdir = ROOT
+bind = os.environ.get('GUNICORN_BIND', settings.GUNICORN_BIND)
+workers = settings.GUNICORN_WORKERS
+worker_class = settings.GUNICORN_WORKER_CLASS
+threads = settings.GUNICORN_THREADS
+worker_connections = settings.GUNICORN_WORKER_CONNECTIONS
+keepalive = settings.GUNICORN_KEEPALIVE
+timeout = settings.GUNICORN_WORKER_TIMEOUT
+graceful_timeout = settings.GUNICORN_GRACEFUL_TIMEOUT
+max_requests = settings.GUNICORN_MAX_REQUESTS
+max_requests_jitter = settings.GUNICORN_MAX_REQUESTS_JITTER
+preload_app = True
+
+accesslog = None  # Apache already logs requests
+errorlog = '-'
+loglevel = 'warning'
+
+# Applies to every thread started after this, i.e. the workers' request threads
+threading.stack_size(settings.GUNICORN_THREAD_STACK_SIZE)
+
+
+def post_fork(server, worker):
+    """Drop database connections inherited from the master (SQLite handles must not cross a fork)"""
+    from app import connection_router
+    from run import app
+    with app.app_context():
+        for engine in connection_router.engines:
+            engine.dispose(close=False)
+    # Held long-polls may take at most a quarter of the request threads, also when --threads overrides them
+    app.config['MESSAGE_POLL_MAX_HELD'] = min(app.config['MESSAGE_POLL_MAX_HELD'], worker.cfg.threads // 4)
@@ -0,0 +1,49 @@
+import pytest
+from app import create_app, db
+from app.models import ConversationParticipant, Message, User
+
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        for name in ('alice', 'bob'):
+            user = User(username=name, email=f'{name}@example.org')
+            user.set_password('password')
+            db.session.add(user)
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def participant(conversation_id, user_id):
+    return db.session.get(ConversationParticipant, (conversation_id, user_id), populate_existing=True)
+
+
+def test_deleting_unread_message_decrements_unread_count(app):
+    first = Message.send(1, 2, 'Hallo Bob', 'Erste Nachricht')
+    Message.send(1, 2, 'Re: Hallo Bob', 'Zweite Nachricht', reply_to=first)
+    db.session.commit()
+    assert participant(first.conversation_id, 2).unread_count == 2
+
+    first.soft_delete(2)
+
+    assert first.is_read
+    bob = participant(first.conversation_id, 2)
+    assert bob.unread_count == 1
+    assert not bob.is_deleted
+    assert participant(first.conversation_id, 1).unread_count == 0
+
+
+def test_deleting_last_visible_message_removes_conversation(app):
+    message = Message.send(1, 2, 'Hallo Bob', 'Einzige Nachricht')
+    db.session.commit()
+
+    message.soft_delete(2)
+
+    bob = participant(message.conversation_id, 2)
+    assert bob.is_deleted
+    assert bob.unread_count == 0
+    assert not participant(message.conversation_id, 1).is_deleted